@@ -0,0 +1,114 @@
+import com.android.apksig.ApkSigner;
+import com.android.apksig.ApkVerifier;
+
+import java.io.File;
+import java.nio.file.Files;
+import java.nio.file.Paths;
+import java.security.KeyStore;
+import java.security.PrivateKey;
+import java.security.cert.Certificate;
+import java.security.cert.X509Certificate;
+import java.util.ArrayList;
+import java.util.HashMap;
+import java.util.List;
+import java.util.Map;
+
+/**
+ * Signs many APKs in one JVM with the keystore loaded once.
+ *
+ * Usage: BatchSign --ks FILE --ks-pass pass:X --key-pass pass:X --ks-key-alias A JOBS
+ * where JOBS holds one tab-separated "input output" pair per line. Prints "OK", "RETRY" or
+ * "FAIL" lines per output, and exits non-zero when any output failed.
+ */
+public class BatchSign {
+    private static final int FALLBACK_MIN_SDK = 21;
+
+    public static void main(String[] args) throws Exception {
+        Map<String, String> options = new HashMap<>();
+        String jobsFile = null;
+        for (int i = 0; i < args.length; i++) {
+            if (args[i].startsWith("--") && i + 1 < args.length) {
+                options.put(args[i], args[++i]);
+            } else {
+                jobsFile = args[i];
+            }
+        }
+
+        char[] storePassword = password(options.get("--ks-pass"));
+        char[] keyPassword = options.containsKey("--key-pass") ? password(options.get("--key-pass")) : storePassword;
+        String alias = options.get("--ks-key-alias");
+
+        KeyStore keyStore = KeyStore.getInstance(new File(options.get("--ks")), storePassword);
+        PrivateKey key = (PrivateKey) keyStore.getKey(alias, keyPassword);
+        List<X509Certificate> certificates = new ArrayList<>();
+        for (Certificate certificate : keyStore.getCertificateChain(alias)) {
+            certificates.add((X509Certificate) certificate);
+        }
+        ApkSigner.SignerConfig signer = new ApkSigner.SignerConfig.Builder(
+            signerName(alias), key, certificates
+        ).build();
+
+        boolean failed = false;
+        for (String line : Files.readAllLines(Paths.get(jobsFile))) {
+            String[] job = line.split("\t");
+            if (job.length != 2) {
+                continue;
+            }
+            File input = new File(job[0]);
+            File output = new File(job[1]);
+            try {
+                Integer minSdk = null;
+                try {
+                    sign(signer, input, output, null);
+                } catch (Exception e) {
+                    // Same retry as the one-file-per-JVM flow, without a new JVM
+                    System.out.println("RETRY\t" + output + "\t" + e);
+                    minSdk = FALLBACK_MIN_SDK;
+                    sign(signer, input, output, minSdk);
+                }
+                verify(output, minSdk);
+                System.out.println("OK\t" + output);
+            } catch (Exception e) {
+                failed = true;
+                output.delete();
+                System.out.println("FAIL\t" + output + "\t" + e);
+            }
+            System.out.flush();
+        }
+        System.exit(failed ? 1 : 0);
+    }
+
+    private static char[] password(String spec) {
+        if (spec == null) {
+            return new char[0];
+        }
+        return (spec.startsWith("pass:") ? spec.substring(5) : spec).toCharArray();
+    }
+
+    private static String signerName(String alias) {
+        // v1 signature file names, as apksigner derives them from the key alias
+        String name = alias.toUpperCase().replaceAll("[^A-Z0-9_-]", "_");
+        return name.length() > 8 ? name.substring(0, 8) : name;
+    }
+
+    private static void sign(ApkSigner.SignerConfig signer, File input, File output, Integer minSdk) throws Exception {
+        ApkSigner.Builder builder = new ApkSigner.Builder(List.of(signer))
+            .setInputApk(input)
+            .setOutputApk(output);
+        if (minSdk != null) {
+            builder.setMinSdkVersion(minSdk);
+        }
+        builder.build().sign();
+    }
+
+    private static void verify(File output, Integer minSdk) throws Exception {
+        ApkVerifier.Builder builder = new ApkVerifier.Builder(output);
+        if (minSdk != null) {
+            builder.setMinCheckedPlatformVersion(minSdk);
+        }
+        ApkVerifier.Result result = builder.build().verify();
+        if (!result.isVerified()) {
+            throw new IllegalStateException("Verification failed: " + result.getErrors());
+        }
+    }
+}
@@ -1,8 +1,9 @@
 import os
 import logging
 import random
-import requests
+from pathlib import Path
 from github import Github
+from src.http_cache import CachedSession, parse_ttls
 
 # --- Auto Generate User-Agent ---
 os_platforms = {
@@ -57,8 +58,19 @@ def generate_user_agent():
     template = browser_templates[browser]
     return template.format(platform=platform, ver=version)
 
+# Local cache root (tool assets, indexes, ...)
+cache_dir = Path(os.getenv('CACHE_DIR', '.cache'))
+
 # --- Requests Session with Random User-Agent ---
-session = requests.Session()
+# HTTP_CACHE=0 disables the page cache, HTTP_CACHE_TTLS="host=seconds,..." overrides TTLs,
+# HTTP_CACHE_MAX_AGE (seconds) and HTTP_CACHE_MAX_MB bound what is kept between runs
+session = CachedSession(
+    cache_dir / "http",
+    enabled=os.getenv('HTTP_CACHE', '1') != '0',
+    ttls=parse_ttls(os.getenv('HTTP_CACHE_TTLS', '')),
+    max_age=int(os.getenv('HTTP_CACHE_MAX_AGE', str(7 * 86400))),
+    max_bytes=int(os.getenv('HTTP_CACHE_MAX_MB', '256')) * 2**20
+)
 session.headers.update({
     'User-Agent': generate_user_agent()
 })
@@ -78,6 +90,39 @@ access_key_id = os.getenv('AWS_ACCESS_KEY_ID')
 secret_access_key = os.getenv('AWS_SECRET_ACCESS_KEY')
 bucket_name = os.getenv('BUCKET_NAME')
 
+# Parallel tool downloads (1 = sequential)
+download_workers = int(os.getenv('DOWNLOAD_WORKERS', '4'))
+
+# Parallel byte-range segments per large download (1 = single stream)
+download_segments = int(os.getenv('DOWNLOAD_SEGMENTS', '4'))
+
+# Batch-resolved latest versions (python -m src.versions)
+version_manifest = Path(os.getenv('VERSION_MANIFEST', 'versions.json'))
+
+# Race all mirrors for the input APK instead of trying them in order
+mirror_race = os.getenv('MIRROR_RACE', '0') == '1'
+mirror_stagger = float(os.getenv('MIRROR_STAGGER', '2'))
+
+# Parallel arch/app builds (1 = sequential in the current directory)
+build_workers = int(os.getenv('BUILD_WORKERS', '1'))
+output_dir = Path(os.getenv('OUTPUT_DIR', '.'))
+workspace_root = Path(os.getenv('WORKSPACE_ROOT', str(cache_dir / "work")))
+
+# Scratch workspaces on tmpfs: auto = when the build fits in free memory, 1 = always, 0 = never
+workspace_tmpfs = os.getenv('WORKSPACE_TMPFS', 'auto')
+tmpfs_root = Path(os.getenv('TMPFS_ROOT', '/dev/shm'))
+
+# Whole-fleet builds (python -m src.fleet): stage concurrency and JVM memory admission
+fleet_network_workers = int(os.getenv('FLEET_NETWORK_WORKERS', '4'))
+fleet_cpu_workers = int(os.getenv('FLEET_CPU_WORKERS', str(os.cpu_count() or 2)))
+jvm_memory_mb = int(os.getenv('JVM_MEMORY_MB', '2048'))
+
+# Reuse signed builds whose inputs are unchanged (0 = always patch)
+build_cache_enabled = os.getenv('BUILD_CACHE', '1') != '0'
+
+# AppCDS archives for tool jars, cached under CACHE_DIR/cds (0 = plain JVM startup)
+java_cds = os.getenv('JAVA_CDS', '1') != '0'
+
 # APKmirror base url
 base_url = "https://www.apkmirror.com"
 gh = Github(github_token) if github_token else Github()
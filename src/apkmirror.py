@@ -1,23 +1,100 @@
 import re
 import json
 import logging
-from bs4 import BeautifulSoup
-from src import base_url, session
+from concurrent.futures import ThreadPoolExecutor
+from src import base_url, session, cache
+from src.parsing import make_soup, find_tag
+
+PROBE_WORKERS = 4
+LINK_CHAIN_CACHE = "apkmirror-links.json"
+FEED_PAGES = 3
+
+def load_link_chains() -> dict:
+    return cache.load_json(LINK_CHAIN_CACHE)
+
+def remember_link_chain(key: str, variant_page: str, download_page: str) -> None:
+    chains = load_link_chains()
+    chains[key] = {"variant_page": variant_page, "download_page": download_page}
+    cache.save_json(LINK_CHAIN_CACHE, chains)
+
+def forget_link_chain(key: str) -> None:
+    chains = load_link_chains()
+    if chains.pop(key, None):
+        cache.save_json(LINK_CHAIN_CACHE, chains)
+
+def fetch_download_link(download_page_url: str) -> str | None:
+    # Download page carries a short-lived token, never serve it from cache
+    response = session.get(download_page_url, cache=False)
+    response.raise_for_status()
+    content_size = len(response.content)
+    logging.info(f"URL:{response.url} [{content_size}/{content_size}] -> Download Page")
+    button = find_tag(response.content, 'a', id='download-link')
+    if button:
+        return base_url + button['href']
+    return None
+
+def probe_url(url: str) -> int | None:
+    """Cheap existence check, None when HEAD can't tell (blocked, error)"""
+    logging.info(f"Checking potential release URL: {url}")
+    try:
+        response = session.head(url, allow_redirects=True, timeout=15)
+        if response.status_code in (200, 404):
+            return response.status_code
+    except Exception as e:
+        logging.debug(f"HEAD {url} failed: {str(e)[:50]}")
+    return None
+
+def fetch_page(url: str):
+    try:
+        response = session.get(url)
+        if response.status_code == 200:
+            return response
+        if response.status_code != 404:
+            logging.warning(f"URL {url} returned status {response.status_code}")
+    except Exception as e:
+        logging.warning(f"Error checking {url}: {str(e)[:50]}")
+    return None
+
+def is_version_page(html: str, version: str, version_checks: list[str]) -> bool:
+    # Check in page text (tags stripped, no parse)
+    page_text = re.sub(r'<(script|style)\b.*?</\1>|<[^>]+>', ' ', html, flags=re.S | re.I)
+    if version in page_text or version.replace('.', '-') in page_text:
+        return True
+    
+    # Check in title and headings, parsing only those tags
+    soup = make_soup(html, ['title', 'h1', 'h2', 'h3'])
+    for tag in soup.find_all(['title', 'h1', 'h2', 'h3']):
+        tag_text = tag.get_text()
+        if any(check and check in tag_text for check in version_checks):
+            return True
+    return False
 
 def get_download_link(version: str, app_name: str, config: dict, arch: str = None) -> str: 
     target_arch = arch if arch else config.get('arch', 'universal')
     
     criteria = [config['type'], target_arch, config['dpi']]
     
+    # Repeat builds of a known variant only need the short-lived final link
+    chain_key = "|".join([config['package'], version, *criteria])
+    chain = load_link_chains().get(chain_key)
+    if chain:
+        logging.info(f"Reusing cached link chain for {app_name} {version}: {chain['download_page']}")
+        try:
+            download_link = fetch_download_link(chain['download_page'])
+            if download_link:
+                return download_link
+        except Exception as e:
+            logging.warning(f"Cached link chain failed: {e}")
+        forget_link_chain(chain_key)
+    
     # --- UNIVERSAL URL FINDER WITH VALIDATION ---
     version_parts = version.split('.')
-    found_soup = None
-    correct_version_page = False
     
     # Use release_prefix if available, otherwise use app name
     release_name = config.get('release_prefix', config['name'])
     
-    # Loop backwards: Try full version, then strip parts
+    # Every candidate in priority order: full version first, then stripped parts
+    candidates = []
     for i in range(len(version_parts), 0, -1):
         current_ver_str = "-".join(version_parts[:i])
         
@@ -39,95 +116,58 @@ def get_download_link(version: str, app_name: str, config: dict, arch: str = Non
             url_patterns.append(f"{base_url}/apk/{config['org']}/{config['name']}/{config['name']}-{current_ver_str}/")
         
         # Remove duplicate patterns
-        url_patterns = list(dict.fromkeys(url_patterns))
+        for url in dict.fromkeys(url_patterns):
+            candidates.append((i, url))
+    
+    # Probe every candidate at once, then fetch the existing ones in
+    # priority order, stopping at the first page for this version
+    with ThreadPoolExecutor(max_workers=PROBE_WORKERS) as pool:
+        statuses = list(pool.map(probe_url, [url for _, url in candidates]))
+    existing = [
+        candidate for candidate, status in zip(candidates, statuses)
+        if status != 404
+    ]
+    
+    found_page = None
+    correct_version_page = False
+    for i, url in existing:
+        response = fetch_page(url)
+        if response is None:
+            continue
         
-        for url in url_patterns:
-            logging.info(f"Checking potential release URL: {url}")
-            
-            try:
-                response = session.get(url)
-                if response.status_code == 200:
-                    soup = BeautifulSoup(response.content, "html.parser")
-                    page_text = soup.get_text()
-                    
-                    # VALIDATION: Check if this page is for our EXACT version
-                    # Check multiple possible version formats
-                    version_checks = [
-                        version,  # 26.1.2.0
-                        version.replace('.', '-'),  # 26-1-2-0
-                        current_ver_str,  # 26-1-2 (if stripped)
-                        ".".join(version_parts[:i])  # 26.1.2 (if stripped)
-                    ]
-                    
-                    # Also check page title and headings for version
-                    title_tag = soup.find('title')
-                    headings = soup.find_all(['h1', 'h2', 'h3'])
-                    
-                    is_correct_page = False
-                    
-                    # Check in page text
-                    for check in version_checks:
-                        if check and check in page_text:
-                            # Additional check: make sure it's not just in a list of other versions
-                            # Look for the version in a context that suggests it's the main version
-                            if check == version or check == version.replace('.', '-'):
-                                is_correct_page = True
-                                break
-                    
-                    # Check in title and headings
-                    if not is_correct_page:
-                        for heading in headings:
-                            heading_text = heading.get_text()
-                            for check in version_checks:
-                                if check and check in heading_text:
-                                    is_correct_page = True
-                                    break
-                            if is_correct_page:
-                                break
-                    
-                    if not is_correct_page and title_tag:
-                        title_text = title_tag.get_text()
-                        for check in version_checks:
-                            if check and check in title_text:
-                                is_correct_page = True
-                                break
-                    
-                    if is_correct_page:
-                        content_size = len(response.content)
-                        logging.info(f"✓ Correct version page found: {response.url}")
-                        found_soup = soup
-                        correct_version_page = True
-                        break  # Found correct page!
-                    else:
-                        # Page exists but doesn't have our version as primary
-                        logging.warning(f"Page found but not for version {version}: {url}")
-                        # Save as fallback ONLY if we haven't found any page yet
-                        if found_soup is None:
-                            found_soup = soup
-                            logging.warning(f"Saved as fallback page (may list multiple versions)")
-                        continue
-                        
-                elif response.status_code == 404:
-                    continue
-                else:
-                    logging.warning(f"URL {url} returned status {response.status_code}")
-                    continue
-                    
-            except Exception as e:
-                logging.warning(f"Error checking {url}: {str(e)[:50]}")
-                continue
+        # VALIDATION: Check if this page is for our EXACT version
+        # Check multiple possible version formats
+        version_checks = [
+            version,  # 26.1.2.0
+            version.replace('.', '-'),  # 26-1-2-0
+            "-".join(version_parts[:i]),  # 26-1-2 (if stripped)
+            ".".join(version_parts[:i])  # 26.1.2 (if stripped)
+        ]
+        
+        if is_version_page(response.text, version, version_checks):
+            logging.info(f"✓ Correct version page found: {response.url}")
+            found_page = response
+            correct_version_page = True
+            break  # Found correct page!
         
-        if correct_version_page:
-            break  # Found correct page for this version part
+        # Page exists but doesn't have our version as primary
+        logging.warning(f"Page found but not for version {version}: {url}")
+        # Save as fallback ONLY if we haven't found any page yet
+        if found_page is None:
+            found_page = response
+            logging.warning(f"Saved as fallback page (may list multiple versions)")
     
     # If we didn't find the exact version page but found a fallback
-    if not correct_version_page and found_soup:
+    if not correct_version_page and found_page:
         logging.warning(f"Using fallback page for {app_name} {version} (may contain multiple versions)")
     
-    if not found_soup:
+    if not found_page:
         logging.error(f"Could not find any release page for {app_name} {version}")
         return None
     
+    # Only the winning page gets parsed, and only its variant rows
+    found_soup = make_soup(found_page.content, 'div', class_='table-row headerFont')
+    
     # --- VARIANT FINDER (works with both exact pages and fallback pages) ---
     rows = found_soup.find_all('div', class_='table-row headerFont')
     download_page_url = None
@@ -176,47 +216,18 @@ def get_download_link(version: str, app_name: str, config: dict, arch: str = Non
         response.raise_for_status()
         content_size = len(response.content)
         logging.info(f"URL:{response.url} [{content_size}/{content_size}] -> Variant Page")
-        soup = BeautifulSoup(response.content, "html.parser")
-
-        sub_url = soup.find('a', class_='downloadButton')
+        sub_url = find_tag(response.content, 'a', class_='downloadButton')
         if sub_url:
             final_download_page_url = base_url + sub_url['href']
-            response = session.get(final_download_page_url)
-            response.raise_for_status()
-            content_size = len(response.content)
-            logging.info(f"URL:{response.url} [{content_size}/{content_size}] -> Download Page")
-            soup = BeautifulSoup(response.content, "html.parser")
-
-            button = soup.find('a', id='download-link')
-            if button:
-                return base_url + button['href']
+            download_link = fetch_download_link(final_download_page_url)
+            if download_link:
+                remember_link_chain(chain_key, download_page_url, final_download_page_url)
+                return download_link
     except Exception as e:
         logging.error(f"Error in download flow: {e}")
     
     return None
 
-    # --- STANDARD DOWNLOAD FLOW (Page 2 -> Page 3 -> Link) ---
-    response = session.get(download_page_url)
-    response.raise_for_status()
-    content_size = len(response.content)
-    logging.info(f"URL:{response.url} [{content_size}/{content_size}] -> Variant Page")
-    soup = BeautifulSoup(response.content, "html.parser")
-
-    sub_url = soup.find('a', class_='downloadButton')
-    if sub_url:
-        final_download_page_url = base_url + sub_url['href']
-        response = session.get(final_download_page_url)
-        response.raise_for_status()
-        content_size = len(response.content)
-        logging.info(f"URL:{response.url} [{content_size}/{content_size}] -> Download Page")
-        soup = BeautifulSoup(response.content, "html.parser")
-
-        button = soup.find('a', id='download-link')
-        if button:
-            return base_url + button['href']
-
-    return None
-
 def get_architecture_criteria(arch: str) -> dict:
     """Map architecture names to APKMirror criteria"""
     arch_mapping = {
@@ -232,7 +243,7 @@ def get_latest_version(app_name: str, config: dict) -> str:
         main_url = f"{base_url}/apk/{config['org']}/{config['name']}/"
         response = session.get(main_url)
         if response.status_code == 200:
-            soup = BeautifulSoup(response.content, "html.parser")
+            soup = make_soup(response.content, 'span')
             # Try to find version in the page
             version_elem = soup.find('span', string=re.compile(r'\d+\.\d+'))
             if version_elem:
@@ -250,9 +261,13 @@ def get_latest_version(app_name: str, config: dict) -> str:
     response.raise_for_status()
     content_size = len(response.content)
     logging.info(f"URL:{response.url} [{content_size}/{content_size}] -> \"-\" [1]")
-    soup = BeautifulSoup(response.content, "html.parser")
+    soup = make_soup(response.content, "div", class_="appRow")
 
     app_rows = soup.find_all("div", class_="appRow")
+    return version_from_rows(app_rows)
+
+def version_from_rows(app_rows) -> str | None:
+    """Newest stable version among uploads feed rows (newest first)"""
     version_pattern = re.compile(r'\d+(\.\d+)*(-[a-zA-Z0-9]+(\.\d+)*)*')
 
     for row in app_rows:
@@ -272,3 +287,34 @@ def get_latest_version(app_name: str, config: dict) -> str:
                     return '.'.join(base_version_parts)
 
     return None
+
+def latest_versions_from_feed(configs: dict, pages: int = FEED_PAGES) -> dict:
+    """Latest versions for many apps at once from the site-wide uploads feed.
+
+    configs maps app_name -> APKMirror config; apps without a recent upload
+    in the first pages of the feed are left out.
+    """
+    urls = [f"{base_url}/uploads/"] + [f"{base_url}/uploads/page/{page}/" for page in range(2, pages + 1)]
+    with ThreadPoolExecutor(max_workers=pages) as pool:
+        responses = list(pool.map(fetch_page, urls))
+
+    rows = []
+    for response in filter(None, responses):
+        soup = make_soup(response.content, "div", class_="appRow")
+        rows.extend(soup.find_all("div", class_="appRow"))
+
+    rows_by_app = {}
+    for row in rows:
+        title = row.find("h5", class_="appRowTitle")
+        link = title.a.get("href", "") if title and title.a else ""
+        for app_name, config in configs.items():
+            if link.startswith(f"/apk/{config['org']}/{config['name']}/"):
+                rows_by_app.setdefault(app_name, []).append(row)
+
+    versions = {}
+    for app_name, app_rows in rows_by_app.items():
+        version = version_from_rows(app_rows)
+        if version:
+            versions[app_name] = version
+    logging.info(f"Uploads feed: {len(versions)}/{len(configs)} app(s) resolved from {len(rows)} rows")
+    return versions
@@ -2,7 +2,7 @@ import json
 import logging 
 
 from src import session 
-from bs4 import BeautifulSoup
+from src.parsing import find_tag
       
 def get_latest_version(app_name: str, config: str) -> str: 
     url = f"https://apkpure.net/{config['name']}/{config['package']}/versions"
@@ -11,11 +11,10 @@ def get_latest_version(app_name: str, config: str) -> str:
     response.raise_for_status()
     content_size = len(response.content)
     logging.info(f"URL:{response.url} [{content_size}/{content_size}] -> \"-\" [1]")
-    soup = BeautifulSoup(response.content, "html.parser")
-    version_info = soup.find('div', class_='ver-top-down')
+    version_info = find_tag(response.content, 'div', class_='ver-top-down')
 
     if version_info:
-        version = version_info['data-dt-version']
+        version = version_info.get('data-dt-version')
         if version:
             return version
             
@@ -24,12 +23,11 @@ def get_latest_version(app_name: str, config: str) -> str:
 def get_download_link(version: str, app_name: str, config: str) ->str:
     url = f"https://apkpure.net/{config['name']}/{config['package']}/download/{version}"
 
-    response = session.get(url)
+    response = session.get(url, cache=False)
     response.raise_for_status()
     content_size = len(response.content)
     logging.info(f"URL:{response.url} [{content_size}/{content_size}] -> \"-\" [1]")
-    soup = BeautifulSoup(response.content, "html.parser")
-    download_link = soup.find('a', id='download_link')
+    download_link = find_tag(response.content, 'a', id='download_link')
     if download_link:
         return download_link['href']
     
@@ -0,0 +1,160 @@
+import os
+import shutil
+import struct
+import logging
+from pathlib import Path
+
+LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+END_RECORD = struct.Struct("<IHHHHIIH")
+LOCAL_SIGNATURE = 0x04034b50
+CENTRAL_SIGNATURE = 0x02014b50
+END_SIGNATURE = 0x06054b50
+DESCRIPTOR_SIGNATURE = 0x08074b50
+ZIP64_MARKER = 0xFFFFFFFF
+COPY_CHUNK = 1024 * 1024
+
+class ZipFormatError(Exception):
+    pass
+
+def _find_end_record(f) -> tuple[int, tuple]:
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    # EOCD is 22 bytes plus a comment of at most 64 KiB
+    tail_size = min(size, END_RECORD.size + 0xFFFF)
+    f.seek(size - tail_size)
+    tail = f.read(tail_size)
+    position = tail.rfind(struct.pack("<I", END_SIGNATURE))
+    if position < 0:
+        raise ZipFormatError("End of central directory not found")
+    return size - tail_size + position, END_RECORD.unpack_from(tail, position)
+
+def read_entries(f) -> list[tuple]:
+    """(central record bytes, name, local offset) for every entry"""
+    _, end = _find_end_record(f)
+    _, disk, _, _, count, cd_size, cd_offset, _ = end
+    if disk or ZIP64_MARKER in (cd_size, cd_offset) or count == 0xFFFF:
+        raise ZipFormatError("Multi-disk and ZIP64 archives are not supported")
+
+    f.seek(cd_offset)
+    data = f.read(cd_size)
+    entries = []
+    position = 0
+    for _ in range(count):
+        fields = CENTRAL_HEADER.unpack_from(data, position)
+        if fields[0] != CENTRAL_SIGNATURE:
+            raise ZipFormatError("Corrupt central directory")
+        name_len, extra_len, comment_len, local_offset = fields[10], fields[11], fields[12], fields[16]
+        if ZIP64_MARKER in (fields[8], fields[9], local_offset):
+            raise ZipFormatError("ZIP64 entries are not supported")
+        end = position + CENTRAL_HEADER.size + name_len + extra_len + comment_len
+        name = data[position + CENTRAL_HEADER.size:position + CENTRAL_HEADER.size + name_len]
+        entries.append((data[position:end], name.decode("utf-8", errors="replace"), local_offset))
+        position = end
+    return entries
+
+def is_intact(path: str | Path) -> bool:
+    """Whether the central directory and every local header it points to are where they belong"""
+    try:
+        with open(path, "rb") as f:
+            end_offset, end = _find_end_record(f)
+            if end[5] + end[6] != end_offset:
+                return False
+            for _, _, local_offset in read_entries(f):
+                f.seek(local_offset)
+                header = f.read(LOCAL_HEADER.size)
+                if len(header) < LOCAL_HEADER.size or LOCAL_HEADER.unpack(header)[0] != LOCAL_SIGNATURE:
+                    return False
+    except (OSError, struct.error, ZipFormatError):
+        return False
+    return True
+
+def _copy_bytes(src, dst, length: int) -> None:
+    while length > 0:
+        chunk = src.read(min(COPY_CHUNK, length))
+        if not chunk:
+            raise ZipFormatError("Unexpected end of archive")
+        dst.write(chunk)
+        length -= len(chunk)
+
+def _alignment(name: str) -> int:
+    # Same rules as zipalign -p: page-aligned native libraries, 4 bytes otherwise
+    return 4096 if name.endswith(".so") else 4
+
+def copy_entry(src, dst, entry: tuple) -> bytes:
+    """Copy one entry's local header, compressed data and descriptor untouched.
+
+    Returns the entry's central directory record for its new position.
+    """
+    central, name, local_offset = entry
+    new_offset = dst.tell()
+    fields = CENTRAL_HEADER.unpack_from(central)
+    flags, method, compressed_size = fields[3], fields[4], fields[8]
+
+    src.seek(local_offset)
+    header = src.read(LOCAL_HEADER.size)
+    local = LOCAL_HEADER.unpack(header)
+    if local[0] != LOCAL_SIGNATURE:
+        raise ZipFormatError(f"Corrupt local header for {name}")
+    name_len, extra_len = local[9], local[10]
+    name_bytes = src.read(name_len)
+    extra = src.read(extra_len)
+
+    if method == 0:
+        # Stored entries keep their alignment by resizing the extra field padding
+        data_offset = dst.tell() + LOCAL_HEADER.size + name_len + len(extra)
+        extra += b"\0" * (-data_offset % _alignment(name))
+        header = LOCAL_HEADER.pack(*local[:10], len(extra))
+
+    dst.write(header + name_bytes + extra)
+    _copy_bytes(src, dst, compressed_size)
+
+    if flags & 0x08:
+        descriptor = src.read(16)
+        has_signature = struct.unpack_from("<I", descriptor)[0] == DESCRIPTOR_SIGNATURE
+        dst.write(descriptor if has_signature else descriptor[:12])
+
+    return central[:42] + struct.pack("<I", new_offset) + central[46:]
+
+def write_central_directory(dst, records: list[bytes]) -> None:
+    cd_offset = dst.tell()
+    for record in records:
+        dst.write(record)
+    cd_size = dst.tell() - cd_offset
+    dst.write(END_RECORD.pack(END_SIGNATURE, 0, 0, len(records), len(records), cd_size, cd_offset, 0))
+
+def _rewrite(input_apk: str | Path, output_apk: Path, dropped) -> tuple[int, int]:
+    removed = 0
+    with open(input_apk, "rb") as src, open(output_apk, "wb") as dst:
+        central_records = []
+        # Local order, so the input is read front to back
+        for entry in sorted(read_entries(src), key=lambda entry: entry[2]):
+            if dropped(entry[1]):
+                removed += 1
+                continue
+            central_records.append(copy_entry(src, dst, entry))
+        write_central_directory(dst, central_records)
+    return len(central_records), removed
+
+def strip_abis(input_apk: str | Path, output_apk: str | Path, keep_abis: list[str]) -> tuple[int, int]:
+    """Copy input_apk to output_apk without native libraries outside keep_abis.
+
+    The input is read once and kept entries are copied byte for byte without
+    recompression. Returns the number of kept and dropped entries.
+    """
+    keep_abis = set(keep_abis)
+
+    def dropped(name: str) -> bool:
+        parts = name.split("/")
+        return len(parts) > 2 and parts[0] == "lib" and parts[1] not in keep_abis
+
+    output_apk = Path(output_apk)
+    tmp_path = output_apk.with_name(f"{output_apk.name}.tmp")
+    try:
+        kept, removed = _rewrite(input_apk, tmp_path, dropped)
+        shutil.move(tmp_path, output_apk)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+    logging.info(f"Stripped {removed} native librar{'y' if removed == 1 else 'ies'} outside {', '.join(sorted(keep_abis))}")
+    return kept, removed
@@ -0,0 +1,43 @@
+import json
+import shutil
+import hashlib
+import logging
+from pathlib import Path
+from src import cache, utils
+
+def fingerprint(app_name: str, source: str, version: str, cli: str | Path, patches: str | Path, arch: str, abis: list[str]) -> str:
+    """Hash of everything a signed build depends on"""
+    selection_path = Path("patches") / f"{app_name}-{source}.txt"
+    inputs = {
+        "app_name": app_name,
+        "source": source,
+        "version": version,
+        "cli": utils.file_sha256(cli),
+        "patches": utils.file_sha256(patches),
+        "selection": selection_path.read_text() if selection_path.exists() else "",
+        "arch": arch,
+        "abis": sorted(abis)
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+def _entry_dir(app_name: str, source: str, arch: str) -> Path:
+    return cache.cache_path("builds", f"{app_name}-{source}-{arch}", "_").parent
+
+def lookup(app_name: str, source: str, arch: str, key: str) -> Path | None:
+    """Cached signed APK for a fingerprint, if there is one"""
+    build_dir = _entry_dir(app_name, source, arch) / key
+    apks = sorted(build_dir.glob("*.apk")) if build_dir.is_dir() else []
+    return apks[0] if apks else None
+
+def store(app_name: str, source: str, arch: str, key: str, signed_apk: str | Path) -> None:
+    """Keep signed_apk as the only cached build of this app, source and arch"""
+    entry_dir = _entry_dir(app_name, source, arch)
+    for stale in entry_dir.iterdir():
+        if stale.name != key:
+            shutil.rmtree(stale, ignore_errors=True)
+
+    build_dir = entry_dir / key
+    build_dir.mkdir(exist_ok=True)
+    signed_apk = Path(signed_apk)
+    cache.link_or_copy(signed_apk, build_dir / signed_apk.name)
+    logging.info(f"Build cached: {signed_apk.name} ({key[:12]})")
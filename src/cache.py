@@ -0,0 +1,68 @@
+import os
+import json
+import shutil
+import logging
+import threading
+from pathlib import Path
+from src import cache_dir
+
+_lock = threading.Lock()
+
+def cache_path(*parts: str) -> Path:
+    path = cache_dir.joinpath(*parts)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path
+
+def load_json(name: str) -> dict:
+    path = cache_path(name)
+    if not path.exists():
+        return {}
+    try:
+        with path.open() as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable cache file {path}: {e}")
+        return {}
+
+def save_json(name: str, data: dict) -> None:
+    path = cache_path(name)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with _lock:
+        with tmp_path.open("w") as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+
+FICLONE = 0x40049409
+
+def reflink(src: Path, dst: Path) -> bool:
+    """Copy-on-write clone of src at dst, where the filesystem supports it (btrfs, XFS, ...)"""
+    try:
+        import fcntl
+        with open(src, "rb") as source, open(dst, "wb") as target:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+        return True
+    except (ImportError, OSError):
+        Path(dst).unlink(missing_ok=True)
+        return False
+
+def clone(src: Path, dst: Path) -> Path:
+    """Independent copy of src at dst, sharing blocks through a reflink when possible"""
+    Path(dst).unlink(missing_ok=True)
+    if not reflink(src, dst):
+        shutil.copyfile(src, dst)
+    return Path(dst)
+
+def link_or_copy(src: Path, dst: Path) -> Path:
+    """Hard link src to dst, falling back to a reflink or copy across filesystems"""
+    if dst.exists():
+        if dst.samefile(src):
+            return dst
+        dst.unlink()
+    try:
+        os.link(src, dst)
+    except OSError:
+        if reflink(src, dst):
+            shutil.copystat(src, dst)
+        else:
+            shutil.copy2(src, dst)
+    return dst
@@ -1,100 +1,580 @@
 import json
+import time
+import hashlib
 import logging
+import threading
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from src.http_cache import RequestCancelled
 from src import (
     utils,
+    cache,
+    versions,
     apkpure,
     session,
     uptodown,
-    apkmirror
+    apkmirror,
+    mirror_stats,
+    mirror_stagger,
+    download_workers,
+    download_segments
 )
 
-def download_resource(url: str, name: str = None) -> Path:
-    with session.get(url, stream=True) as res:
-        res.raise_for_status()
-        final_url = res.url
+MIRRORS = ["apkmirror", "apkpure", "uptodown"]
+APKEDITOR_RELEASE = "apkeditor-release.json"
+APKEDITOR_TTL = 24 * 3600
 
-        if not name:
-            name = utils.extract_filename(res, fallback_url=final_url)
+_stats_lock = threading.Lock()
+_entry_locks = {}
 
-        filepath = Path(name)
-        total_size = int(res.headers.get('content-length', 0))
-        downloaded_size = 0
+RANGED_MIN_SIZE = 16 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+SEGMENT_RETRIES = 3
+STATE_FLUSH_BYTES = 4 * 1024 * 1024
 
-        with filepath.open("wb") as file:
-            for chunk in res.iter_content(chunk_size=8192):
-                if chunk:
-                    file.write(chunk)
-                    downloaded_size += len(chunk)
+class RangeNotSupported(Exception):
+    pass
 
+class RemoteChanged(Exception):
+    """The server no longer has the file a partial download was started from"""
+
+class DownloadVerificationError(Exception):
+    pass
+
+def _write_all(file, chunk: bytes) -> None:
+    view = memoryview(chunk)
+    while view:
+        view = view[file.write(view):]
+
+def _validator(res) -> str | None:
+    """Strong ETag or Last-Modified of a response, usable in If-Range"""
+    etag = res.headers.get('etag')
+    if etag and not etag.startswith("W/"):
+        return etag
+    return res.headers.get('last-modified')
+
+def _stream_to(res, part_path: Path, hasher, state: dict = None) -> int:
+    """Write res to part_path; with state (size, validator) a later run can resume it"""
+    state_path = part_path.with_name(f"{part_path.name}.json")
+    if state is not None:
+        with state_path.open("w") as f:
+            json.dump({**state, "stream": True}, f)
+    downloaded_size = 0
+    with part_path.open("wb") as file:
+        for chunk in res.iter_content(chunk_size=CHUNK_SIZE):
+            if chunk:
+                file.write(chunk)
+                hasher.update(chunk)
+                downloaded_size += len(chunk)
+    state_path.unlink(missing_ok=True)
+    return downloaded_size
+
+def _load_segments(state_path: Path, part_path: Path, total_size: int, segments: int, validator: str | None) -> list[list[int]]:
+    if state_path.exists() or part_path.exists():
+        try:
+            with state_path.open() as f:
+                state = json.load(f)
+            if state.get("size") == total_size and state.get("validator") == validator and part_path.exists():
+                if state.get("stream"):
+                    # An interrupted single stream leaves a clean prefix
+                    return [[0, total_size - 1, min(part_path.stat().st_size, total_size)]]
+                return state["segments"]
+        except (OSError, ValueError, KeyError):
+            pass
+        # Without matching state the .part may hold another version of the file
+        logging.info(f"Discarding stale partial download \"{part_path}\"")
+        _discard(part_path)
+
+    step = -(-total_size // segments)
+    return [
+        [start, min(start + step, total_size) - 1, 0]
+        for start in range(0, total_size, step)
+    ]
+
+def _download_ranged(url: str, part_path: Path, total_size: int, segments: int, hasher, validator: str | None) -> int:
+    """Fetch url into a preallocated part file using parallel byte ranges.
+
+    With a validator every range is sent with If-Range, so a file replaced on
+    the server raises RemoteChanged instead of mixing two versions.
+    """
+    state_path = part_path.with_name(f"{part_path.name}.json")
+    ranges = _load_segments(state_path, part_path, total_size, segments, validator)
+    lock = threading.Lock()
+
+    # The hash follows a cursor through the file: chunks landing exactly at
+    # the cursor are hashed in-stream, anything written ahead of it is read
+    # back (from the page cache) once the cursor catches up
+    hash_lock = threading.Lock()
+    cursor = [0]
+
+    def feed(position: int, chunk: bytes):
+        with hash_lock:
+            if position == cursor[0]:
+                hasher.update(chunk)
+                cursor[0] += len(chunk)
+
+    def catch_up():
+        with hash_lock, part_path.open("rb") as file:
+            for start, end, done in ranges:
+                if cursor[0] > end:
+                    continue
+                if cursor[0] < start:
+                    break
+                available = start + done
+                file.seek(cursor[0])
+                while cursor[0] < available:
+                    chunk = file.read(min(CHUNK_SIZE, available - cursor[0]))
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    cursor[0] += len(chunk)
+                if cursor[0] <= end:
+                    break
+
+    def save_state():
+        with state_path.open("w") as f:
+            json.dump({"size": total_size, "validator": validator, "segments": ranges}, f)
+
+    save_state()
+    with part_path.open("r+b" if part_path.exists() else "wb") as file:
+        file.truncate(total_size)
+
+    resumed = sum(segment[2] for segment in ranges)
+    if resumed:
+        logging.info(f"Resuming \"{part_path}\" at {resumed}/{total_size}")
+        catch_up()
+
+    def fetch(segment: list[int]):
+        start, end, _ = segment
+        for attempt in range(1, SEGMENT_RETRIES + 1):
+            offset = start + segment[2]
+            if offset > end:
+                return
+            try:
+                headers = {"Range": f"bytes={offset}-{end}"}
+                if validator:
+                    headers["If-Range"] = validator
+                with session.get(url, headers=headers, stream=True, timeout=(15, 60)) as res:
+                    res.raise_for_status()
+                    if res.status_code != 206:
+                        raise RemoteChanged(url) if validator else RangeNotSupported(url)
+                    unsaved = 0
+                    with part_path.open("r+b", buffering=0) as file:
+                        file.seek(offset)
+                        for chunk in res.iter_content(chunk_size=CHUNK_SIZE):
+                            if not chunk:
+                                continue
+                            _write_all(file, chunk)
+                            feed(start + segment[2], chunk)
+                            with lock:
+                                segment[2] += len(chunk)
+                                unsaved += len(chunk)
+                                if unsaved >= STATE_FLUSH_BYTES:
+                                    save_state()
+                                    unsaved = 0
+                if start + segment[2] > end:
+                    catch_up()
+                    return
+            except (RangeNotSupported, RemoteChanged):
+                raise
+            except Exception as e:
+                logging.warning(f"Segment {start}-{end} interrupted (attempt {attempt}): {e}")
+        raise RuntimeError(f"Segment {start}-{end} of {url} failed after {SEGMENT_RETRIES} attempts")
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+            for future in [pool.submit(fetch, segment) for segment in ranges]:
+                future.result()
+    finally:
+        with lock:
+            save_state()
+
+    catch_up()
+    state_path.unlink(missing_ok=True)
+    return sum(segment[2] for segment in ranges)
+
+def _discard(part_path: Path) -> None:
+    part_path.unlink(missing_ok=True)
+    part_path.with_name(f"{part_path.name}.json").unlink(missing_ok=True)
+
+def download_resource(
+    url: str,
+    name: str = None,
+    segments: int = download_segments,
+    sha256: str = None,
+    size: int = None,
+    dest_dir: Path = None,
+    keep_partial: bool = True
+) -> Path:
+    """Download url to dest_dir/name (default: the current directory).
+
+    An interrupted download leaves a .part to resume, unless keep_partial is False.
+    """
+    part_path = None
+    try:
+        hasher = hashlib.sha256()
+
+        with session.get(url, stream=True) as res:
+            res.raise_for_status()
+            final_url = res.url
+
+            if not name:
+                name = utils.extract_filename(res, fallback_url=final_url)
+
+            filepath = dest_dir / name if dest_dir else Path(name)
+            part_path = filepath.with_name(f"{filepath.name}.part")
+            total_size = int(res.headers.get('content-length', 0))
+            accepts_ranges = res.headers.get('accept-ranges', '').lower() == 'bytes'
+            validator = _validator(res)
+            # Decoded bytes of a compressed body won't add up to content-length
+            sized = total_size > 0 and not res.headers.get('content-encoding')
+
+            if size is not None and sized and total_size != size:
+                raise DownloadVerificationError(
+                    f"{filepath}: server announced {total_size} bytes, expected {size}"
+                )
+
+            ranged = accepts_ranges and sized and (
+                (segments > 1 and total_size >= RANGED_MIN_SIZE) or part_path.exists()
+            )
+            if not ranged:
+                resumable = accepts_ranges and sized
+                state = {"size": total_size, "validator": validator} if resumable else None
+                downloaded_size = _stream_to(res, part_path, hasher, state)
+                used_segments = 1
+
+        if ranged:
+            used_segments = max(segments, 1)
+            try:
+                downloaded_size = _download_ranged(final_url, part_path, total_size, used_segments, hasher, validator)
+            except RemoteChanged:
+                logging.warning(f"File changed on the server, restarting from zero: {final_url}")
+                _discard(part_path)
+                return download_resource(url, name, segments, sha256, size, dest_dir, keep_partial)
+            except RangeNotSupported:
+                logging.warning(f"Server refused byte ranges, falling back to a single stream: {final_url}")
+                part_path.with_name(f"{part_path.name}.json").unlink(missing_ok=True)
+                hasher = hashlib.sha256()
+                with session.get(final_url, stream=True) as res:
+                    res.raise_for_status()
+                    downloaded_size = _stream_to(res, part_path, hasher)
+                used_segments = 1
+
+        digest = hasher.hexdigest()
+        expected_size = size if size is not None else (total_size if sized else None)
+        if expected_size is not None and downloaded_size != expected_size:
+            _discard(part_path)
+            raise DownloadVerificationError(
+                f"{filepath}: got {downloaded_size} bytes, expected {expected_size}"
+            )
+        if sha256 and digest != sha256.lower():
+            _discard(part_path)
+            raise DownloadVerificationError(
+                f"{filepath}: sha256 {digest} does not match expected {sha256}"
+            )
+
+        part_path.replace(filepath)
         logging.info(
-            f"URL: {final_url} [{downloaded_size}/{total_size}] -> \"{filepath}\" [1]"
+            f"URL: {final_url} [{downloaded_size}/{total_size}] -> \"{filepath}\" [{used_segments}]"
+            + (" (sha256 verified)" if sha256 else "")
         )
 
-    return filepath
+        return filepath
+    except BaseException:
+        if not keep_partial and part_path is not None:
+            _discard(part_path)
+        raise
+
+def asset_sha256(asset: dict) -> str | None:
+    """Expected SHA-256 of a GitHub release asset, when GitHub publishes one"""
+    algorithm, _, value = (asset.get("digest") or "").partition(":")
+    return value if algorithm == "sha256" and value else None
+
+def download_asset(
+    user: str, repo: str, tag: str, asset: dict, dest_dir: Path | None = Path("."), stats: dict = None
+) -> Path:
+    """Fetch a GitHub release asset through the local asset cache.
+
+    The asset is linked into dest_dir; with dest_dir=None the cache entry itself is returned.
+    The hit or miss is counted in stats ({"hits": n, "misses": n}) when given.
+    """
+    entry = cache.cache_path(
+        "assets", user, repo, tag, f"{asset['id']}-{asset['size']}", asset["name"]
+    )
+
+    # Sources sharing a release share its cache entry: one download, the others wait for it
+    with _stats_lock:
+        entry_lock = _entry_locks.setdefault(entry, threading.Lock())
+    with entry_lock:
+        if entry.exists() and entry.stat().st_size == asset["size"]:
+            if stats is not None:
+                with _stats_lock:
+                    stats["hits"] += 1
+            logging.info(f"Asset cache hit: {user}/{repo}@{tag} {asset['name']}")
+        else:
+            if stats is not None:
+                with _stats_lock:
+                    stats["misses"] += 1
+            logging.info(f"Asset cache miss: {user}/{repo}@{tag} {asset['name']}")
+            download_resource(
+                asset["browser_download_url"], str(entry),
+                sha256=asset_sha256(asset), size=asset["size"]
+            )
 
-def download_required(source: str) -> tuple[list[Path], str]:
+    if dest_dir is None:
+        return entry
+    return cache.link_or_copy(entry, dest_dir / asset["name"])
+
+def download_required(
+    source: str,
+    workers: int = download_workers,
+    prefetch_apkeditor: bool = False,
+    dest_dir: Path | None = Path(".")
+) -> tuple[list[Path], str]:
     source_path = Path("sources") / f"{source}.json"
     with source_path.open() as json_file:
         repos_info = json.load(json_file)
 
     name = repos_info[0]["name"]
-    downloaded_files = []
+    repos = [(info['user'], info['repo'], info['tag']) for info in repos_info[1:]]
+    if prefetch_apkeditor:
+        repos.append(("REAndroid", "APKEditor", "latest"))
 
-    for repo_info in repos_info[1:]:
-        user = repo_info['user']
-        repo = repo_info['repo']
-        tag = repo_info['tag']
+    def wanted(user: str, asset: dict) -> bool:
+        if user == "REAndroid":
+            return asset["name"].startswith("APKEditor") and asset["name"].endswith(".jar")
+        return not asset["name"].endswith(".asc")
 
-        release = utils.detect_github_release(user, repo, tag)
-        for asset in release["assets"]:
-            if asset["name"].endswith(".asc"):
-                continue
-            filepath = download_resource(asset["browser_download_url"])
-            downloaded_files.append(filepath)
+    downloaded_files = []
+    stats = {"hits": 0, "misses": 0}
+
+    if workers <= 1:
+        for user, repo, tag in repos:
+            release = utils.detect_github_release(user, repo, tag)
+            for asset in release["assets"]:
+                if wanted(user, asset):
+                    filepath = download_asset(user, repo, release["tag_name"], asset, dest_dir, stats)
+                    downloaded_files.append(filepath)
+    else:
+        # Resolve every repo at once and queue its assets as soon as it lands,
+        # so setup costs roughly the slowest asset instead of the sum
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            releases = {
+                pool.submit(utils.detect_github_release, user, repo, tag): index
+                for index, (user, repo, tag) in enumerate(repos)
+            }
+            asset_futures = [[] for _ in repos]
+            for future in as_completed(releases):
+                index = releases[future]
+                user, repo, _ = repos[index]
+                release = future.result()
+                for asset in release["assets"]:
+                    if wanted(user, asset):
+                        asset_futures[index].append(
+                            pool.submit(download_asset, user, repo, release["tag_name"], asset, dest_dir, stats)
+                        )
+            for futures in asset_futures:
+                downloaded_files.extend(future.result() for future in futures)
 
+    logging.info(
+        f"Asset cache ({source}): {stats['hits']} hit(s), "
+        f"{stats['misses']} miss(es)"
+    )
     return downloaded_files, name
 
-def download_platform(app_name: str, platform: str, cli: str, patches: str, arch: str = None) -> tuple[Path | None, str | None]:
-    try:
-        config_path = Path("apps") / platform / f"{app_name}.json"
-        if not config_path.exists():
-            raise FileNotFoundError(f"Config file not found: {config_path}")
+def needs_apkeditor(app_name: str) -> bool:
+    """True when the APKMirror config for this app asks for a split bundle"""
+    config = versions.load_app_config("apkmirror", app_name)
+    return config is not None and config.get("type", "").upper() == "BUNDLE"
+
+def load_platform_config(app_name: str, platform: str, arch: str = None) -> dict:
+    config = versions.load_app_config(platform, app_name)
+    if config is None:
+        raise FileNotFoundError(f"Config file not found: {versions.app_config_path(platform, app_name)}")
+
+    # Override arch if specified
+    if arch:
+        config['arch'] = arch
+    return config
+
+def resolve_platform(app_name: str, platform: str, cli: str, patches: str, arch: str = None, version: str = None) -> tuple[str | None, str | None]:
+    """Resolve (download_link, version) on one mirror without downloading"""
+    config = load_platform_config(app_name, platform, arch)
+    version = resolve_version(app_name, platform, config, cli, patches, version)
+    return globals()[platform].get_download_link(version, app_name, config), version
 
-        with config_path.open() as json_file:
-            config = json.load(json_file)
-        
-        # Override arch if specified
-        if arch:
-            config['arch'] = arch
+def resolve_version(app_name: str, platform: str, config: dict, cli: str, patches: str, version: str = None) -> str | None:
+    version = config.get("version") or version or utils.get_supported_version(config['package'], cli, patches)
+    return (
+        version
+        or versions.manifest_version(platform, app_name)
+        or globals()[platform].get_latest_version(app_name, config)
+    )
 
+def pinned_version(app_name: str, cli: str, patches: str, arch: str = None, platforms: list[str] = None) -> str | None:
+    """Version fixed by config, patch compatibility or the version manifest, without any scraping"""
+    platforms = platforms or MIRRORS
+    for platform in platforms:
+        try:
+            config = load_platform_config(app_name, platform, arch)
+        except FileNotFoundError:
+            continue
         version = config.get("version") or utils.get_supported_version(config['package'], cli, patches)
-        platform_module = globals()[platform]
-        version = version or platform_module.get_latest_version(app_name, config)
-        
-        download_link = platform_module.get_download_link(version, app_name, config)
-        filepath = download_resource(download_link)
+        if version:
+            return version
+    for platform in platforms:
+        version = versions.manifest_version(platform, app_name)
+        if version:
+            return version
+    return None
+
+def predict_version(app_name: str, cli: str, patches: str, arch: str = None, platforms: list[str] = None) -> str | None:
+    """Version the best ranked mirror would download, without fetching any download page"""
+    for platform in platforms or mirror_stats.rank(app_name, MIRRORS):
+        try:
+            config = load_platform_config(app_name, platform, arch)
+            return resolve_version(app_name, platform, config, cli, patches)
+        except FileNotFoundError:
+            continue
+        except Exception as e:
+            logging.warning(f"Could not resolve {app_name} version on {platform}: {e}")
+    return None
+
+def _timed_download(app_name: str, platform: str, download_link: str, resolve_time: float, dest_dir: Path = None, keep_partial: bool = True) -> Path:
+    started = time.monotonic()
+    try:
+        filepath = download_resource(download_link, dest_dir=dest_dir, keep_partial=keep_partial)
+    except Exception:
+        mirror_stats.record(app_name, platform, False, resolve_time)
+        raise
+    mirror_stats.record(
+        app_name, platform, True, resolve_time,
+        filepath.stat().st_size, time.monotonic() - started
+    )
+    return filepath
+
+def download_platform(app_name: str, platform: str, cli: str, patches: str, arch: str = None, dest_dir: Path = None) -> tuple[Path | None, str | None]:
+    started = time.monotonic()
+    try:
+        download_link, version = resolve_platform(app_name, platform, cli, patches, arch)
+    except Exception as e:
+        logging.error(f"Unexpected error: {e}")
+        mirror_stats.record(app_name, platform, False)
+        return None, None
+
+    resolve_time = time.monotonic() - started
+    if not download_link:
+        logging.error(f"No download link found on {platform} for {app_name}")
+        mirror_stats.record(app_name, platform, False, resolve_time)
+        return None, None
+
+    try:
+        filepath = _timed_download(app_name, platform, download_link, resolve_time, dest_dir)
         return filepath, version 
 
     except Exception as e:
         logging.error(f"Unexpected error: {e}")
         return None, None
 
+def download_racing(
+    app_name: str,
+    cli: str,
+    patches: str,
+    arch: str = None,
+    platforms: list[str] = None,
+    stagger: float = mirror_stagger,
+    dest_dir: Path = None
+) -> tuple[Path | None, str | None]:
+    """Resolve the download link on every mirror at once and download from the first to answer.
+
+    Mirror i starts after i * stagger seconds unless a download has already succeeded;
+    a failed download falls through to the next mirror to resolve a link.
+    """
+    platforms = platforms or mirror_stats.rank(app_name, MIRRORS)
+
+    # Pin the version up front when it's known without scraping a mirror,
+    # otherwise every mirror looks up its own latest version in the race
+    version = pinned_version(app_name, cli, patches, arch, platforms)
+
+    # Set once a download succeeded: mirrors still waiting stay idle and
+    # running resolves are cancelled at their next request
+    found = threading.Event()
+
+    def resolve(index: int, platform: str):
+        if found.wait(index * stagger):
+            return None, None, None
+        started = time.monotonic()
+        try:
+            with session.cancel_on(found):
+                download_link, resolved_version = resolve_platform(app_name, platform, cli, patches, arch, version)
+        except RequestCancelled:
+            return None, None, None
+        except Exception:
+            mirror_stats.record(app_name, platform, False)
+            raise
+        resolve_time = time.monotonic() - started
+        if found.is_set():
+            return None, None, None
+        if download_link:
+            logging.info(f"🏁 {platform} resolved {app_name} v{resolved_version} in {resolve_time:.1f}s")
+        else:
+            mirror_stats.record(app_name, platform, False, resolve_time)
+        return download_link, resolved_version, resolve_time
+
+    pool = ThreadPoolExecutor(max_workers=len(platforms))
+    futures = {pool.submit(resolve, index, platform): platform for index, platform in enumerate(platforms)}
+    try:
+        for future in as_completed(futures):
+            platform = futures[future]
+            try:
+                download_link, resolved_version, resolve_time = future.result()
+            except Exception as e:
+                logging.warning(f"{platform} failed to resolve {app_name}: {e}")
+                continue
+            if not download_link:
+                continue
+
+            try:
+                # A failed mirror's partial file would never be resumed
+                filepath = _timed_download(app_name, platform, download_link, resolve_time, dest_dir, keep_partial=False)
+            except Exception as e:
+                # The mirrors still waiting go ahead, the next resolved link is tried
+                logging.warning(f"Download from {platform} failed: {e}")
+                continue
+            found.set()
+            return filepath, resolved_version
+    finally:
+        # Losers still in flight stop at their next request
+        found.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    return None, None
+
 # Update the specific download functions
-def download_apkmirror(app_name: str, cli: str, patches: str, arch: str = None) -> tuple[Path | None, str | None]:
-    return download_platform(app_name, "apkmirror", cli, patches, arch)
+def download_apkmirror(app_name: str, cli: str, patches: str, arch: str = None, dest_dir: Path = None) -> tuple[Path | None, str | None]:
+    return download_platform(app_name, "apkmirror", cli, patches, arch, dest_dir)
 
-def download_apkpure(app_name: str, cli: str, patches: str, arch: str = None) -> tuple[Path | None, str | None]:
-    return download_platform(app_name, "apkpure", cli, patches, arch)
+def download_apkpure(app_name: str, cli: str, patches: str, arch: str = None, dest_dir: Path = None) -> tuple[Path | None, str | None]:
+    return download_platform(app_name, "apkpure", cli, patches, arch, dest_dir)
 
-def download_uptodown(app_name: str, cli: str, patches: str, arch: str = None) -> tuple[Path | None, str | None]:
-    return download_platform(app_name, "uptodown", cli, patches, arch)
+def download_uptodown(app_name: str, cli: str, patches: str, arch: str = None, dest_dir: Path = None) -> tuple[Path | None, str | None]:
+    return download_platform(app_name, "uptodown", cli, patches, arch, dest_dir)
 
 def download_apkeditor() -> Path:
+    # The latest release is looked up at most once a day, the jar comes from the asset cache
+    known = cache.load_json(APKEDITOR_RELEASE)
+    if known and time.time() - known.get("checked_at", 0) < APKEDITOR_TTL:
+        return download_asset("REAndroid", "APKEditor", known["tag"], known["asset"])
+
     release = utils.detect_github_release("REAndroid", "APKEditor", "latest")
 
     for asset in release["assets"]:
         if asset["name"].startswith("APKEditor") and asset["name"].endswith(".jar"):
-            return download_resource(asset["browser_download_url"])
+            cache.save_json(APKEDITOR_RELEASE, {
+                "checked_at": time.time(),
+                "tag": release["tag_name"],
+                "asset": {key: asset[key] for key in ("id", "name", "size", "digest", "browser_download_url") if key in asset}
+            })
+            return download_asset("REAndroid", "APKEditor", release["tag_name"], asset)
 
     raise RuntimeError("APKEditor .jar file not found in the latest release")
@@ -0,0 +1,244 @@
+import sys
+import time
+import logging
+import threading
+import contextlib
+from pathlib import Path
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from src import (
+    utils,
+    versions,
+    workspace,
+    downloader,
+    output_dir,
+    jvm_memory_mb,
+    fleet_cpu_workers,
+    fleet_network_workers
+)
+from src.pipeline import (
+    tools_from,
+    load_arches,
+    download_input,
+    finalize_input,
+    signed_name,
+    finish_builds,
+    restore_cached,
+    restore_cached_arches,
+    patch_in_workspace
+)
+
+class MemoryGate:
+    """Admits a JVM stage only while the machine has room for its heap.
+
+    Reservations of admitted stages count as used only for the part their
+    JVMs haven't grown into yet: MemAvailable already reflects the rest,
+    estimated as the drop since the first reservation was taken. A stage is
+    always admitted when nothing else holds a reservation, so the fleet can't
+    stall on a small machine.
+    """
+
+    def __init__(self):
+        self.reserved = 0
+        self.baseline = None
+        self.condition = threading.Condition()
+
+    def acquire(self, amount_mb: int) -> None:
+        with self.condition:
+            while self.reserved:
+                available = utils.available_memory_mb()
+                if available is None or self.baseline is None:
+                    break
+                unclaimed = max(self.reserved - max(self.baseline - available, 0), 0)
+                if available - unclaimed >= amount_mb:
+                    break
+                self.condition.wait(timeout=5)
+            if not self.reserved:
+                self.baseline = utils.available_memory_mb()
+            self.reserved += amount_mb
+
+    def release(self, amount_mb: int) -> None:
+        with self.condition:
+            self.reserved -= amount_mb
+            self.condition.notify_all()
+
+class Fleet:
+    """Builds many apps with separate pools for network and CPU/JVM stages"""
+
+    def __init__(self, network_workers: int = fleet_network_workers, cpu_workers: int = fleet_cpu_workers):
+        self.network = ThreadPoolExecutor(max_workers=max(network_workers, 1))
+        self.cpu = ThreadPoolExecutor(max_workers=max(cpu_workers, 1))
+        self.memory = MemoryGate()
+        self.lock = threading.Lock()
+        self.futures = []
+        self.tools = {}
+        self.apkeditor_sources = set()
+        self.built = []
+        self.patched = []
+        self.unsigned_dir = None
+        self.failed = []
+
+    def submit(self, pool: ThreadPoolExecutor, label: str, fn, *args) -> None:
+        def run():
+            try:
+                fn(*args)
+            except BaseException as e:
+                # exit() deep inside a stage arrives here as SystemExit
+                logging.error(f"❌ {label} failed: {e!r}")
+                with self.lock:
+                    self.failed.append(label)
+
+        with self.lock:
+            self.futures.append(pool.submit(run))
+
+    def jvm_stage(self, fn, *args):
+        self.memory.acquire(jvm_memory_mb)
+        try:
+            return fn(*args)
+        finally:
+            self.memory.release(jvm_memory_mb)
+
+    def shared_tools(self, source: str) -> tuple[list[Path], str]:
+        """One tool download per source, shared by every app using it"""
+        with self.lock:
+            future = self.tools.get(source)
+            owner = future is None
+            if owner:
+                future = self.tools[source] = Future()
+
+        if owner:
+            try:
+                # Tools stay in the cache instead of the working directory,
+                # so sources shipping same-named assets can't clobber each other
+                future.set_result(downloader.download_required(
+                    source,
+                    prefetch_apkeditor=source in self.apkeditor_sources,
+                    dest_dir=None
+                ))
+            except BaseException as e:
+                future.set_exception(e)
+        return future.result()
+
+    def fetch_app(self, app_name: str, source: str, arches: list[str]) -> None:
+        """Network stage: tools, cache check and input download.
+
+        The input lives in a workspace of its own, so builds of one app from
+        several sources can't collide; it is removed once the last arch is done.
+        """
+        inputs = contextlib.ExitStack()
+        try:
+            input_dir = inputs.enter_context(workspace.workspace(app_name))
+            queued = self.fetch_input(app_name, source, arches, input_dir, inputs.close)
+        except BaseException:
+            inputs.close()
+            raise
+        if not queued:
+            inputs.close()
+
+    def fetch_input(self, app_name: str, source: str, arches: list[str], input_dir: Path, done) -> bool:
+        tools = tools_from(app_name, source, *self.shared_tools(source))
+
+        cached_apks, pending = restore_cached_arches(tools, arches, output_dir)
+        with self.lock:
+            self.built += cached_apks
+        if not pending:
+            return False
+
+        input_apk, version = download_input(app_name, tools, input_dir)
+        if input_apk is None:
+            raise RuntimeError(f"No input APK for {app_name}")
+        self.submit(self.cpu, f"{app_name} prepare", self.prepare_app, tools, input_apk, version, pending, done)
+        return True
+
+    def prepare_app(self, tools: dict, input_apk: Path, version: str, arches: list[str], done) -> None:
+        """CPU stage: merge and repair the input, then queue one build per arch"""
+        try:
+            merge = input_apk.suffix != ".apk"
+            plan = self.jvm_stage(finalize_input, tools, input_apk, version) if merge else finalize_input(tools, input_apk, version)
+        except BaseException:
+            done()
+            raise
+
+        remaining = [len(arches)]
+        for arch in arches:
+            self.submit(
+                self.cpu, f"{plan['app_name']} {arch}",
+                self.build, plan, arch, remaining, done
+            )
+
+    def build(self, plan: dict, arch: str, remaining: list[int], done) -> None:
+        """CPU stage: strip and patch one arch, queueing it for signing"""
+        try:
+            # The downloaded version may differ from the predicted one
+            apk_path = restore_cached(plan, arch, output_dir)
+            if apk_path:
+                with self.lock:
+                    self.built.append(apk_path)
+                return
+            unsigned_apk = self.jvm_stage(patch_in_workspace, plan, arch, self.unsigned_dir)
+            with self.lock:
+                self.patched.append((plan, arch, unsigned_apk))
+        finally:
+            with self.lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                done()
+
+    def run(self, jobs: list[tuple[str, str, list[str]]]) -> list[str]:
+        # Unsigned APKs wait for the signing run in a workspace of their own
+        with workspace.workspace("unsigned") as self.unsigned_dir:
+            return self._run(jobs)
+
+    def _run(self, jobs: list[tuple[str, str, list[str]]]) -> list[str]:
+        self.apkeditor_sources = {
+            source for app_name, source, _ in jobs if downloader.needs_apkeditor(app_name)
+        }
+        for app_name, source, arches in jobs:
+            self.submit(self.network, f"{app_name} download", self.fetch_app, app_name, source, arches)
+
+        # Stages queue their follow-ups, so wait until nothing new shows up
+        while True:
+            with self.lock:
+                pending = [future for future in self.futures if not future.done()]
+            if not pending:
+                break
+            wait(pending)
+
+        self.network.shutdown()
+        self.cpu.shutdown()
+
+        # One signing run for the whole fleet
+        signed = finish_builds(self.patched, output_dir)
+        self.failed += [
+            f"{plan['app_name']} {arch} signing"
+            for plan, arch, _ in self.patched
+            if not any(Path(apk).name == signed_name(plan, arch) for apk in signed)
+        ]
+        self.built += signed
+        return self.built
+
+def main():
+    """python -m src.fleet [app_name ...]: build the patch list, or the named apps, in one process"""
+    wanted = set(sys.argv[1:])
+    jobs = [
+        (entry["app_name"], entry["source"], load_arches(entry["app_name"], entry["source"]) or ["universal"])
+        for entry in versions.load_patch_list()
+        if not wanted or entry["app_name"] in wanted
+    ]
+    if not jobs:
+        logging.error(f"No apps in patch-config.json match {', '.join(sorted(wanted))}")
+        sys.exit(1)
+
+    started = time.monotonic()
+    fleet = Fleet()
+    built_apks = fleet.run(jobs)
+
+    print(f"\n🎯 Built {len(built_apks)} APK(s) for {len(jobs)} app(s) in {time.monotonic() - started:.0f}s:")
+    for apk in sorted(built_apks):
+        print(f"  📱 {Path(apk).name}")
+    if fleet.failed:
+        print(f"❌ Failed: {', '.join(fleet.failed)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
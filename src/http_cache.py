@@ -0,0 +1,207 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import requests
+import contextlib
+from pathlib import Path
+from urllib.parse import urlparse
+from requests.structures import CaseInsensitiveDict
+
+# Seconds a cached page is served without revalidation, matched by host suffix
+HOST_TTLS = {
+    "apkmirror.com": 1800,
+    "apkpure.net": 1800,
+    "uptodown.com": 1800,
+}
+DEFAULT_TTL = 600
+# Entries older than this are pruned, then the oldest until the cache fits MAX_BYTES
+MAX_AGE = 7 * 86400
+MAX_BYTES = 256 * 2**20
+STORED_HEADERS = ("content-type", "etag", "last-modified", "date")
+
+def parse_ttls(value: str) -> dict:
+    """Parse "host=seconds,host=seconds" overrides"""
+    ttls = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        host, _, seconds = item.partition('=')
+        ttls[host.strip()] = int(seconds)
+    return ttls
+
+class RequestCancelled(requests.RequestException):
+    pass
+
+class CachedSession(requests.Session):
+    """requests.Session caching plain GET pages on disk with per-host TTLs.
+
+    Pass cache=False for pages that must always be fetched fresh, they are
+    never written to disk. The cache directory is pruned to max_age and
+    max_bytes once per process, before the first cached request.
+    """
+
+    def __init__(
+        self, cache_dir: Path, enabled: bool = True, ttls: dict = None,
+        max_age: int = MAX_AGE, max_bytes: int = MAX_BYTES
+    ):
+        super().__init__()
+        self.cache_dir = Path(cache_dir)
+        self.enabled = enabled
+        self.ttls = {**HOST_TTLS, **(ttls or {})}
+        self.max_age, self.max_bytes = max_age, max_bytes
+        self._local = threading.local()
+        self._prune_lock = threading.Lock()
+        self._pruned = False
+
+    @contextlib.contextmanager
+    def cancel_on(self, event: threading.Event):
+        """Requests from the current thread raise RequestCancelled once event is set"""
+        previous = getattr(self._local, "cancel", None)
+        self._local.cancel = event
+        try:
+            yield
+        finally:
+            self._local.cancel = previous
+
+    def ttl_for(self, url: str) -> int:
+        host = urlparse(url).hostname or ""
+        for suffix, ttl in self.ttls.items():
+            if host == suffix or host.endswith(f".{suffix}"):
+                return ttl
+        return DEFAULT_TTL
+
+    def _entry(self, url: str) -> tuple[Path, Path]:
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return self.cache_dir / f"{key}.json", self.cache_dir / f"{key}.body"
+
+    def prune(self) -> None:
+        """Drop expired entries and leftovers, then the oldest entries past max_bytes"""
+        now = time.time()
+        entries = []
+        for path in self.cache_dir.glob("*"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue  # Removed by another process
+            if path.suffix == ".tmp":
+                if now - stat.st_mtime > 3600:
+                    path.unlink(missing_ok=True)
+            elif path.suffix == ".json":
+                body_path = path.with_suffix(".body")
+                try:
+                    size = stat.st_size + body_path.stat().st_size
+                except OSError:
+                    size = None
+                entries.append((stat.st_mtime, size, path, body_path))
+            elif not path.with_suffix(".json").exists():
+                path.unlink(missing_ok=True)  # Body without its metadata
+
+        # The metadata is rewritten on every store and revalidation, so its mtime is the entry's age
+        entries.sort(key=lambda entry: entry[0], reverse=True)
+        kept, removed = 0, 0
+        for mtime, size, meta_path, body_path in entries:
+            if size is not None and now - mtime <= self.max_age and kept + size <= self.max_bytes:
+                kept += size
+                continue
+            meta_path.unlink(missing_ok=True)
+            body_path.unlink(missing_ok=True)
+            removed += 1
+        if removed:
+            logging.info(f"🧹 HTTP cache: pruned {removed} entries, {kept / 2**20:.1f} MB kept")
+
+    def _prune_once(self) -> None:
+        with self._prune_lock:
+            if not self._pruned:
+                self._pruned = True
+                self.prune()
+
+    def _load(self, url: str) -> tuple[dict, bytes] | tuple[None, None]:
+        meta_path, body_path = self._entry(url)
+        try:
+            with meta_path.open() as f:
+                meta = json.load(f)
+            return meta, body_path.read_bytes()
+        except (OSError, ValueError):
+            return None, None
+
+    def _store(self, url: str, response: requests.Response) -> None:
+        meta_path, body_path = self._entry(url)
+        meta = {
+            "url": response.url,
+            "status": response.status_code,
+            "reason": response.reason,
+            "encoding": response.encoding,
+            "headers": {
+                k.lower(): v for k, v in response.headers.items() if k.lower() in STORED_HEADERS
+            },
+            "stored_at": time.time(),
+        }
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        body_tmp = body_path.with_name(body_path.name + suffix)
+        meta_tmp = meta_path.with_name(meta_path.name + suffix)
+        body_tmp.write_bytes(response.content)
+        with meta_tmp.open("w") as f:
+            json.dump(meta, f)
+        os.replace(body_tmp, body_path)
+        os.replace(meta_tmp, meta_path)
+
+    def _touch(self, url: str, meta: dict) -> None:
+        meta_path, _ = self._entry(url)
+        meta["stored_at"] = time.time()
+        tmp_path = meta_path.with_name(f"{meta_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with tmp_path.open("w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+
+    @staticmethod
+    def _build_response(meta: dict, body: bytes) -> requests.Response:
+        response = requests.Response()
+        response.status_code = meta["status"]
+        response.reason = meta.get("reason") or "OK"
+        response.url = meta["url"]
+        response.encoding = meta.get("encoding")
+        response.headers = CaseInsensitiveDict(meta["headers"])
+        response._content = body
+        response.from_cache = True
+        return response
+
+    def request(self, method, url, *args, cache: bool = True, **kwargs):
+        cancel = getattr(self._local, "cancel", None)
+        if cancel is not None and cancel.is_set():
+            raise RequestCancelled(f"Cancelled: {url}")
+
+        headers = kwargs.get("headers") or {}
+        if (
+            not self.enabled or not cache or method.upper() != "GET"
+            or kwargs.get("stream") or args or "Range" in headers
+        ):
+            return super().request(method, url, *args, **kwargs)
+
+        self._prune_once()
+        meta, body = self._load(url)
+        if meta is not None and time.time() - meta["stored_at"] < self.ttl_for(url):
+            logging.debug(f"HTTP cache hit: {url}")
+            return self._build_response(meta, body)
+
+        if meta is not None:
+            headers = dict(headers)
+            if meta["headers"].get("etag"):
+                headers["If-None-Match"] = meta["headers"]["etag"]
+            if meta["headers"].get("last-modified"):
+                headers["If-Modified-Since"] = meta["headers"]["last-modified"]
+            kwargs["headers"] = headers
+
+        response = super().request(method, url, **kwargs)
+
+        if meta is not None and response.status_code == 304:
+            logging.debug(f"HTTP cache revalidated: {url}")
+            self._touch(url, meta)
+            return self._build_response(meta, body)
+
+        cache_control = response.headers.get("cache-control", "").lower()
+        if response.status_code == 200 and "no-store" not in cache_control:
+            self._store(url, response)
+
+        return response
@@ -0,0 +1,69 @@
+import time
+import logging
+import threading
+from src import cache
+
+STATS_FILE = "mirror-stats.json"
+HALF_LIFE = 7 * 24 * 3600
+EWMA_WEIGHT = 0.3
+DEFAULT_RESOLVE_TIME = 10.0
+REFERENCE_SIZE = 100 * 1024 * 1024
+
+_lock = threading.Lock()
+
+def _decayed(entry: dict, now: float) -> tuple[float, float]:
+    factor = 0.5 ** ((now - entry.get("updated", now)) / HALF_LIFE)
+    return entry.get("successes", 0.0) * factor, entry.get("failures", 0.0) * factor
+
+def record(app_name: str, mirror: str, success: bool, resolve_time: float = None, size: int = None, download_time: float = None) -> None:
+    """Record one attempt of app_name on mirror"""
+    now = time.time()
+    with _lock:
+        stats = cache.load_json(STATS_FILE)
+        entry = stats.setdefault(app_name, {}).setdefault(mirror, {})
+        successes, failures = _decayed(entry, now)
+        entry["successes"] = successes + (1 if success else 0)
+        entry["failures"] = failures + (0 if success else 1)
+        entry["updated"] = now
+
+        if resolve_time is not None:
+            previous = entry.get("resolve_time")
+            entry["resolve_time"] = resolve_time if previous is None else (
+                EWMA_WEIGHT * resolve_time + (1 - EWMA_WEIGHT) * previous
+            )
+        if size and download_time:
+            throughput = size / max(download_time, 0.001)
+            previous = entry.get("throughput")
+            entry["throughput"] = throughput if previous is None else (
+                EWMA_WEIGHT * throughput + (1 - EWMA_WEIGHT) * previous
+            )
+
+        cache.save_json(STATS_FILE, stats)
+
+def expected_cost(entry: dict, now: float) -> float:
+    """Expected seconds until a successful download, assuming retries on failure"""
+    successes, failures = _decayed(entry, now)
+    success_rate = (successes + 1) / (successes + failures + 2)
+    seconds = entry.get("resolve_time", DEFAULT_RESOLVE_TIME)
+    if entry.get("throughput"):
+        seconds += REFERENCE_SIZE / entry["throughput"]
+    return seconds / success_rate
+
+def rank(app_name: str, mirrors: list[str]) -> list[str]:
+    """Order mirrors best first for app_name, keeping the given order for ties and unknowns"""
+    now = time.time()
+    stats = cache.load_json(STATS_FILE).get(app_name, {})
+    if not stats:
+        return list(mirrors)
+
+    known = [m for m in mirrors if m in stats]
+    unknown = [m for m in mirrors if m not in stats]
+    ordered = sorted(known, key=lambda m: expected_cost(stats[m], now))
+    # An untried mirror goes ahead of ones that have only ever failed
+    result = [m for m in ordered if stats[m].get("successes", 0) > 0.05]
+    result += unknown
+    result += [m for m in ordered if m not in result]
+
+    if result != list(mirrors):
+        logging.info(f"Mirror order for {app_name}: {', '.join(result)}")
+    return result
@@ -0,0 +1,77 @@
+from html.parser import HTMLParser
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    from lxml import etree
+    PARSER = "lxml"
+except ImportError:
+    etree = None
+    PARSER = "html.parser"
+
+FEED_SIZE = 64 * 1024
+
+def make_soup(content: bytes | str, *args, **kwargs) -> BeautifulSoup:
+    """Parse with the fastest installed backend.
+
+    Positional/keyword arguments build a SoupStrainer, so only the matching
+    elements (and their children) end up in the tree.
+    """
+    parse_only = SoupStrainer(*args, **kwargs) if args or kwargs else None
+    return BeautifulSoup(content, PARSER, parse_only=parse_only)
+
+def _matches(tag: str, attrs: dict, name: str, wanted: dict) -> bool:
+    if tag != name:
+        return False
+    for key, value in wanted.items():
+        if key == "class_":
+            classes = (attrs.get("class") or "").split()
+            if not all(token in classes for token in value.split()):
+                return False
+        elif attrs.get(key) != value:
+            return False
+    return True
+
+class _Found(Exception):
+    pass
+
+class _TagFinder(HTMLParser):
+    def __init__(self, name: str, wanted: dict):
+        super().__init__(convert_charrefs=True)
+        self.name = name
+        self.wanted = wanted
+        self.found = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {key: value or "" for key, value in attrs}
+        if _matches(tag, attrs, self.name, self.wanted):
+            self.found = attrs
+            raise _Found
+
+def find_tag(content: bytes | str, name: str, **wanted) -> dict | None:
+    """Attributes of the first <name> tag matching wanted, or None.
+
+    The document is fed in chunks and parsing stops at the first match.
+    Use class_ for class tokens, like BeautifulSoup.
+    """
+    if etree is not None:
+        data = content.encode() if isinstance(content, str) else content
+        parser = etree.HTMLPullParser(events=("start",))
+        offsets = range(0, len(data), FEED_SIZE)
+        for offset in [*offsets, None]:
+            if offset is None:
+                parser.close()
+            else:
+                parser.feed(data[offset:offset + FEED_SIZE])
+            for _, element in parser.read_events():
+                if isinstance(element.tag, str) and _matches(element.tag, dict(element.attrib), name, wanted):
+                    return dict(element.attrib)
+        return None
+
+    text = content.decode("utf-8", errors="replace") if isinstance(content, bytes) else content
+    finder = _TagFinder(name, wanted)
+    try:
+        for offset in range(0, len(text), FEED_SIZE):
+            finder.feed(text[offset:offset + FEED_SIZE])
+    except _Found:
+        pass
+    return finder.found
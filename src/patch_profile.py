@@ -0,0 +1,108 @@
+import re
+import json
+import time
+import logging
+from pathlib import Path
+from src import cache
+
+# revanced-cli announces a phase when it starts and reports a patch when it ends
+PHASES = [
+    ("decoding", re.compile(r"Decoding|Reading (?:dex|resources)|Initializing|Merging (?:extensions|integrations)", re.I)),
+    ("compiling", re.compile(r"Compiling|Writing (?:modified|patched) (?:dex|resources)", re.I)),
+    ("aligning", re.compile(r"Aligning|Writing patched files|Saved to|Saving", re.I)),
+    ("signing", re.compile(r"Signing", re.I)),
+    ("cleanup", re.compile(r"Purging", re.I))
+]
+PATCH_RESULT = re.compile(r'^(?:INFO|SEVERE|WARNING):\s*"?(?P<name>.+?)"? (?P<status>succeeded|failed)\b')
+
+# A patch counts as slower when it took this much longer than in the last run
+SLOWDOWN_RATIO = 1.5
+SLOWDOWN_SECONDS = 2.0
+
+class PatchProfile:
+    """Timestamps revanced-cli patch output and splits the run into phases and patches.
+
+    Durations have line granularity: a phase lasts until the next phase line,
+    and a patch from the line before its result to the result itself.
+    """
+
+    def __init__(self):
+        self.started = self.last_line = self.phase_started = time.monotonic()
+        self.phase = "loading"
+        self.phases = {}
+        self.patches = {}
+        self.failed = []
+
+    def _enter(self, phase: str, now: float) -> None:
+        if phase != self.phase:
+            self.phases[self.phase] = self.phases.get(self.phase, 0.0) + now - self.phase_started
+            self.phase, self.phase_started = phase, now
+
+    def feed(self, line: str) -> None:
+        now = time.monotonic()
+        line = line.strip()
+        result = PATCH_RESULT.match(line)
+        if result:
+            # The time since the last line was spent in this patch
+            self._enter("patching", self.last_line)
+            self.patches[result["name"]] = round(now - self.last_line, 3)
+            if result["status"] == "failed":
+                self.failed.append(result["name"])
+        else:
+            for phase, pattern in PHASES:
+                if pattern.search(line):
+                    self._enter(phase, now)
+                    break
+        self.last_line = now
+
+    def finish(self) -> dict:
+        now = time.monotonic()
+        self._enter(None, now)
+        return {
+            "total": round(now - self.started, 3),
+            "phases": {phase: round(seconds, 3) for phase, seconds in self.phases.items()},
+            "patches": self.patches,
+            "failed": self.failed
+        }
+
+def profile_path(apk: str | Path) -> Path:
+    return Path(apk).with_suffix(".profile.json")
+
+def _history_name(app_name: str, source: str, arch: str) -> str:
+    return f"profiles/{app_name}-{source}-{arch}.json"
+
+def slower_patches(previous: dict, current: dict) -> list[tuple[str, float, float]]:
+    """(patch, previous seconds, seconds) for patches that got noticeably slower"""
+    slower = []
+    for name, seconds in current.get("patches", {}).items():
+        before = previous.get("patches", {}).get(name)
+        if before is not None and seconds >= before * SLOWDOWN_RATIO and seconds - before >= SLOWDOWN_SECONDS:
+            slower.append((name, before, seconds))
+    return slower
+
+def save(profile: PatchProfile, output_apk: Path, app_name: str, source: str, arch: str, context: dict) -> dict:
+    """Write the profile next to output_apk, warning about patches slower than in the last run.
+
+    context (app version, tool names, ...) is stored along, so a slowdown can
+    be told apart from an upstream patches update.
+    """
+    data = {"build": context, **profile.finish()}
+    profile_path(output_apk).write_text(json.dumps(data, indent=2))
+
+    previous = cache.load_json(_history_name(app_name, source, arch))
+    if previous:
+        previous_build = previous.get("build", {})
+        changed = [f"{key} {previous_build.get(key)} → {value}" for key, value in context.items() if previous_build.get(key) != value]
+        for name, was, seconds in slower_patches(previous, data):
+            logging.warning(
+                f"🐢 {app_name} {arch}: \"{name}\" took {seconds:.1f}s, was {was:.1f}s"
+                + (f" ({', '.join(changed)})" if changed else "")
+            )
+    cache.save_json(_history_name(app_name, source, arch), data)
+
+    phases = ", ".join(f"{phase} {seconds:.1f}s" for phase, seconds in data["phases"].items())
+    slowest = sorted(data["patches"].items(), key=lambda item: item[1], reverse=True)[:3]
+    logging.info(f"⏱️ {app_name} {arch}: patched in {data['total']:.1f}s ({phases})")
+    if slowest:
+        logging.info("Slowest patches: " + ", ".join(f"{name} {seconds:.1f}s" for name, seconds in slowest))
+    return data
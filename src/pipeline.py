@@ -0,0 +1,293 @@
+import json
+import shutil
+import logging
+from sys import exit
+from pathlib import Path
+import subprocess
+from src import (
+    cache,
+    apkzip,
+    utils,
+    signing,
+    build_cache,
+    workspace,
+    patch_profile,
+    downloader,
+    output_dir,
+    mirror_race,
+    mirror_stats,
+    build_cache_enabled
+)
+
+def prepare_tools(app_name: str, source: str) -> dict:
+    """Fetch the patching tools of a source for an app"""
+    # Bundles are merged by APKEditor, fetched along with the tools instead of after the download
+    download_files, name = downloader.download_required(
+        source, prefetch_apkeditor=downloader.needs_apkeditor(app_name)
+    )
+    return tools_from(app_name, source, download_files, name)
+
+def tools_from(app_name: str, source: str, download_files: list[Path], name: str) -> dict:
+    return {
+        "app_name": app_name,
+        "source": source,
+        "name": name,
+        "files": download_files,
+        "cli": utils.find_file(download_files, 'revanced-cli', '.jar'),
+        "patches": utils.find_file(download_files, 'patches', '.rvp')
+    }
+
+def prepare_build(app_name: str, source: str, tools: dict = None, work_dir: Path = None) -> dict | None:
+    """Fetch tools, resolve the version and acquire the input APK once per app.
+
+    The input and its intermediates go to work_dir (default: the current directory).
+    """
+    tools = tools or prepare_tools(app_name, source)
+    input_apk, version = download_input(app_name, tools, work_dir)
+    if input_apk is None:
+        return None
+    return finalize_input(tools, input_apk, version)
+
+def download_input(app_name: str, tools: dict, work_dir: Path = None) -> tuple[Path | None, str | None]:
+    """Network half of prepare_build: resolve and download the input APK"""
+    revanced_cli, revanced_patches = tools["cli"], tools["patches"]
+
+    download_methods = {
+        "apkmirror": downloader.download_apkmirror,
+        "apkpure": downloader.download_apkpure,
+        "uptodown": downloader.download_uptodown
+    }
+
+    input_apk = None
+    version = None
+    if mirror_race:
+        input_apk, version = downloader.download_racing(app_name, revanced_cli, revanced_patches, dest_dir=work_dir)
+    else:
+        # Historically fastest and most reliable mirror first
+        for platform in mirror_stats.rank(app_name, list(download_methods)):
+            input_apk, version = download_methods[platform](app_name, revanced_cli, revanced_patches, dest_dir=work_dir)
+            if input_apk:
+                break
+            
+    if input_apk is None:
+        logging.error(f"❌ Failed to download APK for {app_name}")
+        logging.error("All download sources failed. Skipping this app.")
+    return input_apk, version
+
+def finalize_input(tools: dict, input_apk: Path, version: str) -> dict:
+    """Local half of prepare_build: merge split bundles and repair the input APK"""
+    app_name, download_files = tools["app_name"], tools["files"]
+
+    if input_apk.suffix != ".apk":
+        logging.warning("Input file is not .apk, using APKEditor to merge")
+        apk_editor = (
+            utils.find_file(download_files, 'APKEditor', '.jar')
+            or downloader.download_apkeditor()
+        )
+
+        merged_apk = input_apk.with_suffix(".apk")
+
+        utils.run_java(apk_editor, [
+            "m",
+            "-i", str(input_apk),
+            "-o", str(merged_apk)
+        ], silent=True)
+
+        input_apk.unlink(missing_ok=True)
+
+        if not merged_apk.exists():
+            logging.error("Merged APK file not found")
+            exit(1)
+
+        input_apk = merged_apk
+        logging.info(f"Merged APK file generated: {input_apk}")
+
+    # FIX: Repair corrupted APK from Uptodown
+    logging.info("Checking APK for corruption...")
+    if apkzip.is_intact(input_apk):
+        # Rewriting a sound archive would only cost another full copy
+        return {**tools, "version": version, "input_apk": input_apk}
+    try:
+        fixed_apk = input_apk.with_name(f"{app_name}-fixed-v{version}.apk")
+        subprocess.run([
+            "zip", "-FF", str(input_apk), "--out", str(fixed_apk)
+        ], check=False, capture_output=True)
+        
+        if fixed_apk.exists() and fixed_apk.stat().st_size > 0:
+            input_apk.unlink(missing_ok=True)
+            fixed_apk.rename(input_apk)
+            logging.info("APK fixed successfully")
+    except Exception as e:
+        logging.warning(f"Could not fix APK: {e}")
+
+    return {**tools, "version": version, "input_apk": input_apk}
+
+def build_fingerprint(plan: dict, arch: str) -> str:
+    return build_cache.fingerprint(
+        plan["app_name"], plan["source"], plan["version"],
+        plan["cli"], plan["patches"],
+        arch, load_abis(plan["app_name"], plan["source"], arch)
+    )
+
+def restore_cached(plan: dict, arch: str, out_dir: Path = None) -> str | None:
+    """Signed APK from the build cache when none of its inputs changed"""
+    if not build_cache_enabled:
+        return None
+    cached_apk = build_cache.lookup(plan["app_name"], plan["source"], arch, build_fingerprint(plan, arch))
+    if cached_apk is None:
+        return None
+
+    out_dir = out_dir or Path(".")
+    out_dir.mkdir(parents=True, exist_ok=True)
+    signed_apk = cache.link_or_copy(cached_apk, out_dir / cached_apk.name)
+    print(f"♻️ Inputs unchanged, reusing cached build: {signed_apk.name}")
+    return str(signed_apk)
+
+def restore_cached_arches(tools: dict, arches: list[str], out_dir: Path = output_dir) -> tuple[list[str], list[str]]:
+    """(cached APKs, arches still to build) for the version the mirrors would serve.
+
+    Lets a fully cached app skip even the input download.
+    """
+    built_apks = []
+    pending = list(arches)
+    version = build_cache_enabled and downloader.predict_version(tools["app_name"], tools["cli"], tools["patches"])
+    if version:
+        for arch in arches:
+            apk_path = restore_cached({**tools, "version": version}, arch, out_dir)
+            if apk_path:
+                built_apks.append(apk_path)
+                pending.remove(arch)
+    return built_apks, pending
+
+def signed_name(plan: dict, arch: str) -> str:
+    return f"{plan['app_name']}-{arch}-{plan['name']}-v{plan['version']}.apk"
+
+def patch_arch(plan: dict, arch: str = "universal", work_dir: Path = None, out_dir: Path = None) -> Path:
+    """Strip and patch one architecture from a prepared build plan, returning the unsigned APK.
+
+    Intermediates go to work_dir and the unsigned APK to out_dir (both
+    default to the current directory).
+    """
+    app_name, source, version = plan["app_name"], plan["source"], plan["version"]
+    revanced_cli, revanced_patches = plan["cli"], plan["patches"]
+    work_dir = work_dir or Path(".")
+    out_dir = out_dir or Path(".")
+
+    # Every arch works on its own copy, the prepared input stays untouched.
+    # Native libraries of other ABIs are left out of the copy in the same pass.
+    input_apk = work_dir / f"{app_name}-{arch}-input-v{version}.apk"
+    keep_abis = load_abis(app_name, source, arch)
+    logging.info(f"Processing APK for {arch} architecture (keeping {', '.join(keep_abis)})...")
+    try:
+        apkzip.strip_abis(plan["input_apk"], input_apk, keep_abis)
+    except apkzip.ZipFormatError as e:
+        logging.warning(f"Could not strip native libraries, building with all ABIs: {e}")
+        cache.clone(plan["input_apk"], input_apk)
+    workspace.checkpoint(work_dir)
+
+    exclude_patches = []
+    include_patches = []
+
+    patches_path = Path("patches") / f"{app_name}-{source}.txt"
+    if patches_path.exists():
+        with patches_path.open('r') as patches_file:
+            for line in patches_file:
+                line = line.strip()
+                if line.startswith('-'):
+                    exclude_patches.extend(["-d", line[1:].strip()])
+                elif line.startswith('+'):
+                    include_patches.extend(["-e", line[1:].strip()])
+
+    # Patched output waits in out_dir until the signing stage
+    output_apk = out_dir / signed_name(plan, arch)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    # revanced-cli's temporary files stay in the workspace instead of next to the output
+    profile = patch_profile.PatchProfile()
+
+    def on_line(line: str):
+        phase = profile.phase
+        profile.feed(line)
+        if profile.phase != phase:
+            # Decoded resources and temporary files peak between phases, before the final purge
+            workspace.checkpoint(work_dir)
+
+    utils.run_java(revanced_cli, [
+        "patch", "--patches", str(Path(revanced_patches).resolve()),
+        "--out", str(output_apk.resolve()), str(input_apk.resolve()),
+        "--temporary-files-path", str((work_dir / "revanced-temp").resolve()),
+        # APKs are signed later, the keystore revanced-cli generates stays in the workspace
+        "--keystore", str((work_dir / "revanced.keystore").resolve()),
+        *exclude_patches, *include_patches
+    ], cwd=work_dir, stream=True, on_line=on_line)
+    workspace.checkpoint(work_dir)
+    patch_profile.save(profile, output_apk, app_name, source, arch, {
+        "version": version,
+        "cli": Path(revanced_cli).name,
+        "patches": Path(revanced_patches).name
+    })
+
+    input_apk.unlink(missing_ok=True)
+    return output_apk
+
+def finish_builds(patched: list[tuple[dict, str, Path]], out_dir: Path = None) -> list[str]:
+    """Sign every (plan, arch, unsigned APK) in one signing run and cache the results"""
+    out_dir = out_dir or Path(".")
+    out_dir.mkdir(parents=True, exist_ok=True)
+    jobs = [(unsigned_apk, out_dir / signed_name(plan, arch)) for plan, arch, unsigned_apk in patched]
+    # Signing removes the unsigned APKs, their workspace is at its fullest right now
+    for unsigned_dir in {Path(unsigned_apk).parent for _, _, unsigned_apk in patched}:
+        workspace.checkpoint(unsigned_dir)
+    signed = set(signing.sign_all(jobs))
+
+    built_apks = []
+    for (plan, arch, unsigned_apk), (_, signed_apk) in zip(patched, jobs):
+        profile = patch_profile.profile_path(unsigned_apk)
+        if signed_apk not in signed:
+            profile.unlink(missing_ok=True)
+            continue
+        if profile.exists():
+            shutil.move(profile, patch_profile.profile_path(signed_apk))
+        print(f"✅ APK built: {signed_apk.name}")
+        if build_cache_enabled:
+            build_cache.store(plan["app_name"], plan["source"], arch, build_fingerprint(plan, arch), signed_apk)
+        built_apks.append(str(signed_apk))
+    return built_apks
+
+def patch_in_workspace(plan: dict, arch: str, out_dir: Path) -> Path:
+    # Stripped copy, decoded resources and the rebuilt APK: a few times the input
+    size_hint = plan["input_apk"].stat().st_size * 4
+    with workspace.workspace(f"{plan['app_name']}-{arch}", size_hint) as work_dir:
+        return patch_arch(plan, arch, work_dir, out_dir)
+
+DEFAULT_ABIS = {
+    "arm64-v8a": ["arm64-v8a"],
+    "armeabi-v7a": ["armeabi-v7a"],
+    "universal": ["arm64-v8a", "armeabi-v7a", "armeabi"]
+}
+
+def load_arch_config(app_name: str, source: str) -> dict | None:
+    """arch-config.json entry for an app, {} when not listed, None when the file is missing"""
+    arch_config_path = Path("arch-config.json")
+    if not arch_config_path.exists():
+        return None
+
+    with open(arch_config_path) as f:
+        arch_config = json.load(f)
+
+    for config in arch_config:
+        if config["app_name"] == app_name and config["source"] == source:
+            return config
+    return {}
+
+def load_arches(app_name: str, source: str) -> list[str] | None:
+    """Arches for an app from arch-config.json, None when the file is missing"""
+    config = load_arch_config(app_name, source)
+    if config is None:
+        return None
+    return config.get("arches", ["universal"])  # default
+
+def load_abis(app_name: str, source: str, arch: str) -> list[str]:
+    """ABIs whose native libraries are kept in an arch build ("abis" in arch-config.json)"""
+    abis = (load_arch_config(app_name, source) or {}).get("abis", {})
+    return abis.get(arch) or DEFAULT_ABIS.get(arch, [arch])
@@ -2,7 +2,8 @@ import re
 import json
 from sys import exit
 from pathlib import Path
-from src import repository, gh
+from github import UnknownObjectException
+from src import repository, gh, utils
 
 def convert_title(text):
     if not text or not isinstance(text, str):
@@ -46,13 +47,13 @@ def create_github_release(name, patches_name, cli_name, apk_file_path):
                 asset.delete_asset()
 
     # Step 3: Delete old releases with the same base name and matching version suffix
-    releases = list(repo.get_releases())
+    releases, fetched = utils.resolve_releases(repo)
 
     suffix_match = re.search(r'(-[a-z]+\.\d+)$', patchver)
     current_suffix = suffix_match.group(1) if suffix_match else ''
 
-    for release in releases:
-        release_tag = release.tag_name
+    for entry in releases:
+        release_tag = entry["tag"]
         if release_tag.startswith(f"{name}-v") and release_tag != tag_name:
             old_version = release_tag[len(name) + 2:]
             old_suffix_match = re.search(r'(-[a-z]+\.\d+)$', old_version)
@@ -62,7 +63,12 @@ def create_github_release(name, patches_name, cli_name, apk_file_path):
                 old_numeric = re.sub(r'(-[a-z]+\.\d+)?(-release\d*)?$', '', old_version)
                 current_numeric = re.sub(r'(-[a-z]+\.\d+)?(-release\d*)?$', '', patchver)
                 if old_numeric < current_numeric:
-                    release.delete_release()
+                    try:
+                        release = fetched.get(entry["id"]) or repo.get_release(entry["id"])
+                        release.delete_release()
+                    except UnknownObjectException:
+                        pass
+                    utils.forget_release(repo, entry["id"])
 
     # Step 4: Create new release if it doesn't exist
     if not existing_release:
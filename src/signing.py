@@ -0,0 +1,93 @@
+import shutil
+import hashlib
+import logging
+import tempfile
+from pathlib import Path
+from src import cache, utils
+
+BATCH_SIGN_SOURCE = Path(__file__).with_name("BatchSign.java")
+KEYSTORE_ARGS = [
+    "--ks", "keystore/public.jks",
+    "--ks-pass", "pass:public",
+    "--key-pass", "pass:public",
+    "--ks-key-alias", "public"
+]
+
+def _batch_sign_classes(apksigner_jar: str) -> Path | None:
+    """Compiled BatchSign helper for this apksigner.jar, built once into the cache"""
+    digest = hashlib.sha256(BATCH_SIGN_SOURCE.read_bytes())
+    digest.update(utils.file_sha256(apksigner_jar).encode())
+    classes_dir = cache.cache_path("batchsign", digest.hexdigest()[:16], "_").parent
+    if (classes_dir / "BatchSign.class").exists():
+        return classes_dir
+
+    if not shutil.which("javac"):
+        logging.warning("javac not found, signing one APK per apksigner run")
+        return None
+    utils.run_process([
+        "javac", "-nowarn", "-cp", apksigner_jar,
+        "-d", str(classes_dir), str(BATCH_SIGN_SOURCE)
+    ], silent=True, check=False)
+    return classes_dir if (classes_dir / "BatchSign.class").exists() else None
+
+def _sign_with_apksigner(unsigned_apk: Path, signed_apk: Path) -> bool:
+    """Per-file apksigner run, with the min-sdk retry in a second run"""
+    apksigner_jar = utils.find_apksigner_jar()
+    apksigner = None if apksigner_jar else utils.find_apksigner()
+    if not apksigner_jar and not apksigner:
+        return False
+
+    for extra in ([], ["--min-sdk-version", "21"]):
+        signed_apk.unlink(missing_ok=True)
+        args = ["sign", "--verbose", *extra, *KEYSTORE_ARGS, "--in", str(unsigned_apk), "--out", str(signed_apk)]
+        if apksigner_jar:
+            utils.run_java(apksigner_jar, args, stream=True, check=False)
+        else:
+            utils.run_process([str(apksigner), *args], stream=True, check=False)
+        if signed_apk.exists():
+            return True
+        if not extra:
+            logging.warning(f"apksigner failed for {unsigned_apk.name}, retrying with --min-sdk-version 21")
+    return False
+
+def sign_all(jobs: list[tuple[Path, Path]]) -> list[Path]:
+    """Sign every (unsigned, signed) pair, returning the outputs that were signed.
+
+    All APKs go through one JVM with the keystore loaded once; each output is
+    verified there and retried with min-sdk 21 on its own. Anything the batch
+    can't sign falls back to a separate apksigner run.
+    """
+    if not jobs:
+        return []
+
+    signed = set()
+    apksigner_jar = utils.find_apksigner_jar()
+    classes_dir = _batch_sign_classes(apksigner_jar) if apksigner_jar else None
+    if classes_dir:
+        with tempfile.NamedTemporaryFile("w", suffix=".tsv", delete=False) as jobs_file:
+            for unsigned_apk, signed_apk in jobs:
+                jobs_file.write(f"{Path(unsigned_apk).resolve()}\t{Path(signed_apk).resolve()}\n")
+        try:
+            output = utils.run_java(
+                apksigner_jar, [*KEYSTORE_ARGS, jobs_file.name],
+                main_class="BatchSign", classpath=[classes_dir],
+                capture=True, check=False
+            ) or ""
+        finally:
+            Path(jobs_file.name).unlink(missing_ok=True)
+
+        for line in output.splitlines():
+            status, _, path = line.partition("\t")
+            if status == "OK":
+                signed.add(Path(path.split("\t")[0]))
+        logging.info(f"Batch signing: {len(signed)}/{len(jobs)} APK(s) signed in one run")
+
+    results = []
+    for unsigned_apk, signed_apk in jobs:
+        signed_apk = Path(signed_apk)
+        if signed_apk.resolve() in signed or _sign_with_apksigner(Path(unsigned_apk), signed_apk):
+            results.append(signed_apk)
+        else:
+            logging.error(f"❌ Could not sign {signed_apk.name}")
+        Path(unsigned_apk).unlink(missing_ok=True)
+    return results
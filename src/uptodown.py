@@ -1,98 +1,252 @@
 import logging 
-from src import session 
-from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
+from src import session, cache, utils
+from src.parsing import make_soup, find_tag
 
-def get_latest_version(app_name: str, config: dict) -> str:
-    # Generate all possible Uptodown names
-    possible_names = generate_possible_uptodown_names(config)
-    
+SLUG_CACHE = "uptodown-slugs.json"
+PROBE_WORKERS = 8
+
+def fetch_versions_page(uptodown_name: str):
+    url = f"https://{uptodown_name}.en.uptodown.com/android/versions"
+    try:
+        response = session.get(url, timeout=10)
+        if response.status_code == 200:
+            return response
+        logging.debug(f"✗ Not found: {url}")
+    except Exception as e:
+        logging.debug(f"Failed for {url}: {str(e)[:50]}...")
+    return None
+
+def forget_app_slug(package: str, app: dict) -> None:
+    """Drop the cached app for package if it is app"""
+    slugs = cache.load_json(SLUG_CACHE)
+    if slugs.get(package) == app:
+        del slugs[package]
+        cache.save_json(SLUG_CACHE, slugs)
+
+def remember_app(package: str, app: dict) -> None:
+    slugs = cache.load_json(SLUG_CACHE)
+    if slugs.get(package) != app:
+        slugs[package] = app
+        cache.save_json(SLUG_CACHE, slugs)
+
+def candidate_apps(app_name: str, config: dict):
+    """Uptodown apps ({"slug", "data_code"}) to try: the cached one, then probed slugs.
+
+    Slugs are probed concurrently but yielded in rank order, and only when
+    their page carries the app's data-code. Probing starts only once the
+    cached app has been turned down.
+    """
+    package = config.get('package', '')
+    cached = cache.load_json(SLUG_CACHE).get(package)
+    if cached and not cached.get("data_code"):
+        cached = None  # Accepted before data-codes were required
+    if cached:
+        yield cached
+
+    # Generate all possible Uptodown names, most likely first
+    possible_names = [
+        name for name in rank_uptodown_names(config, generate_possible_uptodown_names(config))
+        if not cached or name != cached["slug"]
+    ]
     logging.info(f"Trying {len(possible_names)} possible Uptodown names for {app_name}")
-    
-    for uptodown_name in possible_names:
-        url = f"https://{uptodown_name}.en.uptodown.com/android/versions"
-        try:
-            response = session.get(url)
-            if response.status_code == 200:
-                content_size = len(response.content)
-                logging.info(f"✓ Found: {response.url}")
-                soup = BeautifulSoup(response.content, "html.parser")
-                version_spans = soup.select('#versions-items-list .version')
-                versions = [span.text for span in version_spans]
-                
-                if versions:
-                    highest_version = max(versions)
-                    logging.info(f"Found version {highest_version} for {app_name}")
-                    return highest_version
-            elif response.status_code == 404:
-                logging.debug(f"✗ Not found: {url}")
+
+    pool = ThreadPoolExecutor(max_workers=PROBE_WORKERS)
+    futures = [pool.submit(fetch_versions_page, name) for name in possible_names]
+    try:
+        for uptodown_name, future in zip(possible_names, futures):
+            response = future.result()
+            if not response:
+                continue
+            app_title = find_tag(response.content, 'h1', id='detail-app-name')
+            data_code = app_title.get('data-code') if app_title else None
+            if not data_code:
+                logging.debug(f"✗ No app data on {response.url}")
                 continue
+            logging.info(f"✓ Found: {response.url}")
+            yield {"slug": uptodown_name, "data_code": data_code}
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def get_latest_version(app_name: str, config: dict) -> str:
+    package = config.get('package', '')
+    for app in candidate_apps(app_name, config):
+        response = fetch_versions_page(app["slug"])
+        if response:
+            soup = make_soup(response.content, id='versions-items-list')
+            version_spans = soup.select('#versions-items-list .version')
+            versions = [span.text for span in version_spans]
+
+            if versions:
+                highest_version = utils.get_highest_version(versions)
+                logging.info(f"Found version {highest_version} for {app_name}")
+                remember_app(package, app)
+                return highest_version
+
+        # A slug without versions is wrong or stale, try the next one
+        forget_app_slug(package, app)
+
+    raise Exception(f"Could not find Uptodown page for {app_name}")
+
+def compare_versions(a: str, b: str) -> int:
+    a, b = utils.normalize_version(a), utils.normalize_version(b)
+    return (a > b) - (a < b)
+
+def find_version_entry(uptodown_name: str, data_code: str, version: str) -> dict | None:
+    """versionURL of one version, from a cached index of the versions API.
+
+    Only head pages newer than the index are fetched; older versions are
+    found by galloping then bisecting over pages, which come newest first.
+    """
+    index_name = f"uptodown-versions/{data_code}.json"
+    index = cache.load_json(index_name)
+    versions = index.get("versions", {})
+    newest_id = index.get("newest_id")
+    head = index.get("head", 0)
+    page_size = index.get("page_size")
+    fetched = {}
+
+    def fetch_page(page: int) -> list[dict]:
+        nonlocal head, page_size
+        if page not in fetched:
+            response = session.get(
+                f"https://{uptodown_name}.en.uptodown.com/android/apps/{data_code}/versions/{page}",
+                cache=False
+            )
+            response.raise_for_status()
+            entries = response.json().get('data', [])
+            fetched[page] = entries
+            for entry in entries:
+                versions.setdefault(entry["version"], entry["versionURL"])
+            if page == 1 and entries:
+                page_size = max(page_size or 0, len(entries))
+            # Pages touching the indexed head extend it
+            if page_size and (page - 1) * page_size <= head:
+                head = max(head, (page - 1) * page_size + len(entries))
+        return fetched[page]
+
+    # Head pages: stop as soon as we reach the newest version already indexed
+    first_page = fetch_page(1)
+    if first_page:
+        new_entries = 0
+        reached = newest_id is None
+        page = 1
+        entries = first_page
+        while entries and newest_id is not None:
+            ids = [entry["versionURL"]["versionID"] for entry in entries]
+            if newest_id in ids:
+                new_entries += ids.index(newest_id)
+                reached = True
+                break
+            new_entries += len(entries)
+            page += 1
+            entries = fetch_page(page)
+        if newest_id is not None:
+            # Newer versions pushed the old head down the pages
+            head = (index.get("head", 0) + new_entries) if reached else new_entries
+            head = max(head, len(first_page))
+        newest_id = first_page[0]["versionURL"]["versionID"]
+
+    try:
+        if version in versions or not page_size:
+            return versions.get(version)
+
+        def older_than_page(page: int) -> bool:
+            entries = fetch_page(page)
+            return bool(entries) and compare_versions(entries[-1]["version"], version) > 0
+
+        # Gallop past the indexed head, then bisect for the page holding version
+        low = head // page_size + 1
+        high = low
+        while version not in versions and older_than_page(high):
+            low = high + 1
+            high *= 2
+        while version not in versions and low < high:
+            middle = (low + high) // 2
+            if older_than_page(middle):
+                low = middle + 1
             else:
-                response.raise_for_status()
-        except Exception as e:
-            logging.debug(f"Failed for {url}: {str(e)[:50]}...")
-            continue
+                high = middle
+        if version not in versions:
+            # Release order isn't always version order, look at the neighbour
+            fetch_page(max(low - 1, 1))
+            fetch_page(low + 1)
+
+        logging.info(f"Uptodown versions index: {len(fetched)} page(s) fetched for {version}")
+        return versions.get(version)
+    finally:
+        cache.save_json(index_name, {
+            "versions": versions,
+            "newest_id": newest_id,
+            "head": head,
+            "page_size": page_size
+        })
+
+def find_version_link(uptodown_name: str, data_code: str, version: str) -> str | None:
+    version_url_parts = find_version_entry(uptodown_name, data_code, version)
+    if not version_url_parts:
+        return None
+
+    version_url = f"{version_url_parts['url']}/{version_url_parts['extraURL']}/{version_url_parts['versionID']}"
+    version_page = session.get(version_url, cache=False)
+    version_page.raise_for_status()
+    button = find_tag(version_page.content, 'button', id='detail-download-button')
+    if not button:
+        return None
+        
+    onclick = button.get('onclick', '')
+    if onclick and "download-link-deeplink" in onclick:
+        version_url += '-x'
+        version_page = session.get(version_url, cache=False)
+        version_page.raise_for_status()
+        button = find_tag(version_page.content, 'button', id='detail-download-button')
     
-    raise Exception(f"Could not find Uptodown page for {app_name}")
+    if button and 'data-url' in button:
+        download_url = button['data-url']
+        return f"https://dw.uptodown.com/dwn/{download_url}"
+
+    return None
 
 def get_download_link(version: str, app_name: str, config: dict) -> str:
-    # Generate all possible Uptodown names
-    possible_names = generate_possible_uptodown_names(config)
-    
-    logging.info(f"Searching {len(possible_names)} possible Uptodown names for {app_name} v{version}")
-    
-    for uptodown_name in possible_names:
-        base_url = f"https://{uptodown_name}.en.uptodown.com/android"
+    logging.info(f"Searching Uptodown for {app_name} v{version}")
+
+    package = config.get('package', '')
+    for app in candidate_apps(app_name, config):
         try:
-            response = session.get(f"{base_url}/versions")
-            if response.status_code != 200:
-                continue
-                
-            soup = BeautifulSoup(response.content, "html.parser")
-            data_code = soup.find('h1', id='detail-app-name')['data-code']
-
-            page = 1
-            while True:
-                response = session.get(f"{base_url}/apps/{data_code}/versions/{page}")
-                response.raise_for_status()
-                version_data = response.json().get('data', [])
-                
-                if not version_data:
-                    break
-                    
-                for entry in version_data:
-                    if entry["version"] == version:
-                        version_url_parts = entry["versionURL"]
-                        version_url = f"{version_url_parts['url']}/{version_url_parts['extraURL']}/{version_url_parts['versionID']}"
-                        version_page = session.get(version_url)
-                        version_page.raise_for_status()
-                        soup = BeautifulSoup(version_page.content, "html.parser")
-                        
-                        button = soup.find('button', id='detail-download-button')
-                        if not button:
-                            continue
-                            
-                        onclick = button.get('onclick', '')
-                        if onclick and "download-link-deeplink" in onclick:
-                            version_url += '-x'
-                            version_page = session.get(version_url)
-                            version_page.raise_for_status()
-                            soup = BeautifulSoup(version_page.content, "html.parser")
-                            button = soup.find('button', id='detail-download-button')
-                        
-                        if button and 'data-url' in button.attrs:
-                            download_url = button['data-url']
-                            return f"https://dw.uptodown.com/dwn/{download_url}"
-                
-                if all(entry["version"] < version for entry in version_data):
-                    break
-                page += 1
+            download_link = find_version_link(app["slug"], app["data_code"], version)
         except Exception as e:
-            logging.debug(f"Pattern {uptodown_name} failed: {str(e)[:50]}...")
+            logging.debug(f"Pattern {app['slug']} failed: {str(e)[:50]}...")
+            forget_app_slug(package, app)
             continue
-    
+        if download_link:
+            remember_app(package, app)
+            return download_link
+
     logging.error(f"Version {version} not found for {app_name}")
     return None
 
+def rank_uptodown_names(config: dict, names: list) -> list:
+    """Order slug guesses from most to least likely"""
+    app_name = config.get('name', '').lower()
+    package_dash = config.get('package', '').replace('.', '-').lower()
+    preferred = [
+        app_name,
+        app_name.replace('-', ''),
+        package_dash,
+        package_dash.replace('com-', '', 1),
+        package_dash.split('-')[-1],
+    ]
+
+    def score(name: str) -> tuple:
+        lowered = name.lower()
+        if lowered in preferred:
+            return (0, preferred.index(lowered), name != lowered, name)
+        if lowered.startswith(app_name):
+            return (1, len(name), name != lowered, name)
+        return (2, len(name), name != lowered, name)
+
+    return sorted(names, key=score)
+
 def generate_possible_uptodown_names(config: dict) -> list:
     """Generate all possible Uptodown URL patterns from config data"""
     app_name = config.get('name', '')
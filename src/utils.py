@@ -1,9 +1,13 @@
 import re
+import os
+import hashlib
 import logging
+import threading
 import cgi
 import json
-from typing import List, Optional
-from src import gh
+from typing import Callable, List, Optional
+from src import gh, cache, java_cds
+from github import UnknownObjectException
 from sys import exit
 import subprocess
 from pathlib import Path
@@ -32,6 +36,15 @@ def find_apksigner() -> str | None:
     logging.error("No apksigner found in build-tools")
     return None
 
+def find_apksigner_jar() -> str | None:
+    """apksigner.jar next to the apksigner wrapper, so it can run as a plain java -jar tool"""
+    apksigner = find_apksigner()
+    if apksigner:
+        jar_path = Path(apksigner).parent / "lib" / "apksigner.jar"
+        if jar_path.exists():
+            return str(jar_path)
+    return None
+
 def run_process(
     command: List[str],
     cwd: Optional[Path] = None,
@@ -39,7 +52,8 @@ def run_process(
     stream: bool = False,
     silent: bool = False,
     check: bool = True,
-    shell: bool = False
+    shell: bool = False,
+    on_line: Optional[Callable[[str], None]] = None
 ) -> Optional[str]:
     process = subprocess.Popen(
         command,
@@ -59,6 +73,8 @@ def run_process(
                     print(line.rstrip(), flush=True)
                 if capture:
                     output_lines.append(line)
+                if on_line:
+                    on_line(line)
         process.stdout.close()
         return_code = process.wait()
 
@@ -74,6 +90,95 @@ def run_process(
         print(f"Error while running command: {e}", flush=True)
         exit(1)
 
+_java_major = None
+_java_version = ""
+
+def java_major_version() -> int:
+    """Major version of the java on PATH, 0 when it can't be told"""
+    global _java_major, _java_version
+    if _java_major is None:
+        try:
+            output = subprocess.run(
+                ["java", "-version"], capture_output=True, text=True
+            ).stderr
+            match = re.search(r'version "((\d+)(?:\.(\d+))?[^"]*)"', output)
+            major = int(match.group(2)) if match else 0
+            # Java 8 and older report themselves as 1.x
+            _java_major = int(match.group(3) or 0) if major == 1 else major
+            _java_version = match.group(1) if match else ""
+        except OSError:
+            _java_major = 0
+    return _java_major
+
+def available_memory_mb() -> int | None:
+    """MemAvailable from /proc/meminfo, None where it isn't available"""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+def cds_archive(jar: str | Path, variant: str = "") -> Path:
+    """Class-data-sharing archive for a tool jar, keyed by the jar's content and the JDK"""
+    jar = Path(jar)
+    name = f"{jar.stem}-{variant}" if variant else jar.stem
+    java_major_version()
+    key = hashlib.sha256(f"{file_sha256(jar)}:{_java_version}".encode()).hexdigest()
+    return cache.cache_path("cds", f"{name}-{key[:16]}.jsa")
+
+def run_java(
+    jar: str | Path,
+    args: List[str],
+    main_class: Optional[str] = None,
+    classpath: Optional[List[Path]] = None,
+    **kwargs
+) -> Optional[str]:
+    """java -jar with an AppCDS archive created on first use and reused afterwards.
+
+    The first run (Java 13+) dumps it at exit into a private file that is
+    moved into place once the run succeeds, so concurrent first runs never
+    write to an archive another JVM has mapped. A changed jar or JDK gets a
+    new archive.
+    With main_class, jar and classpath go on -cp and main_class is run instead.
+    """
+    jar = Path(jar).resolve()
+    if main_class:
+        classpath = [jar, *(Path(entry).resolve() for entry in classpath or [])]
+        launch = ["-cp", os.pathsep.join(map(str, classpath)), main_class]
+        variant = "-".join([main_class, *(entry.name for entry in classpath[1:])])
+    else:
+        launch = ["-jar", str(jar)]
+        variant = ""
+
+    options = []
+    dumped = None
+    major = java_major_version() if java_cds else 0
+    if major >= 13:
+        archive = cds_archive(jar, variant)
+        # The JVM reports archive mismatches on stdout, where they'd pollute captured output
+        options.append("-Xlog:cds=off,cds+dynamic=off")
+        if archive.exists():
+            options.append(f"-XX:SharedArchiveFile={archive}")
+        else:
+            dumped = archive.with_name(f"{archive.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            options.append(f"-XX:ArchiveClassesAtExit={dumped}")
+
+    succeeded = False
+    try:
+        output = run_process(["java", *options, *launch, *args], **kwargs)
+        succeeded = True
+        return output
+    finally:
+        if dumped is not None and dumped.exists():
+            if succeeded and dumped.stat().st_size > 0 and not archive.exists():
+                dumped.replace(archive)
+                logging.info(f"CDS archive created for {jar.name}")
+            else:
+                dumped.unlink(missing_ok=True)
+
 def normalize_version(version: str) -> list[int]:
     parts = version.split('.')
     normalized = []
@@ -94,29 +199,70 @@ def get_highest_version(versions: list[str]) -> str | None:
             highest_version = v
     return highest_version
 
-def get_supported_version(package_name: str, cli: str, patches: str) -> Optional[str]:
-    output = run_process([
-        'java', '-jar', cli,
-        'list-versions',
-        '-f', package_name,
-        patches
-    ], capture=True, silent=True)
-
-    if not output:
-        logging.warning("No output returned from list-versions command")
-        return None
+_file_hashes = {}
+_compat_matrices = {}
+_compat_lock = threading.Lock()
 
-    lines = output.splitlines()
-    if len(lines) <= 2:
-        logging.warning("Output has no version lines")
-        return None
+def file_sha256(path: str | Path) -> str:
+    path = Path(path)
+    stat = path.stat()
+    key = (str(path.resolve()), stat.st_size, stat.st_mtime_ns)
+    if key not in _file_hashes:
+        digest = hashlib.sha256()
+        with path.open("rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        _file_hashes[key] = digest.hexdigest()
+    return _file_hashes[key]
 
-    versions = []
-    for line in lines[2:]:
-        version, _, _ = line.partition(' ')
-        version = version.strip()
+def parse_list_versions(output: str) -> dict[str, list[str]]:
+    """package -> versions from list-versions output; an empty list means any version"""
+    matrix = {}
+    package = None
+    for line in output.splitlines():
+        if "Package name:" in line:
+            package = line.split("Package name:", 1)[1].strip()
+            matrix.setdefault(package, [])
+            continue
+        if package is None or ':' in line:
+            continue
+        version, _, _ = line.strip().partition(' ')
         if version and 'Any' not in line:
-            versions.append(version)
+            matrix[package].append(version)
+    return matrix
+
+def compatibility_matrix(cli: str, patches: str) -> dict[str, list[str]]:
+    """Supported versions of every package in a patches file.
+
+    Computed with a single list-versions run per patches file and cached on
+    disk by the file's hash, so later lookups need no JVM.
+    """
+    key = f"{file_sha256(patches)}-{Path(cli).name}"
+    with _compat_lock:
+        if key in _compat_matrices:
+            return _compat_matrices[key]
+
+        cache_name = f"compat/{key}.json"
+        matrix = cache.load_json(cache_name).get("matrix")
+        if matrix is None:
+            output = run_java(cli, [
+                'list-versions',
+                patches
+            ], capture=True, silent=True)
+
+            if not output:
+                logging.warning("No output returned from list-versions command")
+                return {}
+
+            matrix = parse_list_versions(output)
+            cache.save_json(cache_name, {"matrix": matrix})
+            logging.info(f"Compatibility matrix built for {len(matrix)} package(s)")
+
+        _compat_matrices[key] = matrix
+        return matrix
+
+def get_supported_version(package_name: str, cli: str, patches: str) -> Optional[str]:
+    versions = compatibility_matrix(cli, patches).get(package_name)
 
     if not versions:
         logging.warning("No supported versions found")
@@ -144,6 +290,112 @@ def extract_filename(response, fallback_url=None) -> str:
     path = urlparse(fallback_url or response.url).path
     return unquote(Path(path).name)
 
+def _release_entry(release) -> dict:
+    return {
+        "id": release.id,
+        "tag": release.tag_name,
+        "created_at": release.created_at.isoformat(),
+        "prerelease": release.prerelease
+    }
+
+def _release_index_name(repo_obj) -> str:
+    return f"releases/{repo_obj.full_name}.json"
+
+def resolve_releases(repo_obj, predicate=None) -> tuple[list[dict], dict]:
+    """Newest-first release index for repo_obj, backed by a persisted cache.
+
+    Pages are fetched only until they reach releases already in the index,
+    and, when a predicate is given, only until the newest matching release
+    is known. Stopping on a match above the indexed releases leaves a gap,
+    recorded by the id of the release it follows, that later walks fill in.
+    Returns the index entries and the Release objects fetched on the way.
+    """
+    index_name = _release_index_name(repo_obj)
+    index = cache.load_json(index_name)
+    known = index.get("releases", [])
+    known_ids = {entry["id"] for entry in known}
+    complete = index.get("complete", False)
+    gaps = set(index.get("gaps", []))
+
+    def resolved(entries: list[dict]) -> bool:
+        """Whether no further page can change the answer"""
+        if predicate is None:
+            return complete and not gaps
+        for entry in entries:
+            if predicate(entry):
+                return True
+            if entry["id"] in gaps:
+                return False
+        return False
+
+    fetched = {}
+    fresh = []
+    pages = iter(repo_obj.get_releases())
+    reached_known = exhausted = False
+    for release in pages:
+        if release.id in known_ids:
+            reached_known = True
+            break
+        fetched[release.id] = release
+        fresh.append(_release_entry(release))
+        # Releases come newest first, so the first match is the newest one
+        if predicate is not None and predicate(fresh[-1]):
+            break
+    else:
+        exhausted = True
+
+    if exhausted:
+        entries, complete, gaps = fresh, True, set()
+    else:
+        entries = fresh + known
+        if fresh and known and not reached_known:
+            # Stopped on a match before reaching the index, the releases in between are unknown
+            gaps.add(fresh[-1]["id"])
+
+    if not exhausted and not resolved(entries):
+        # Keep walking, slotting releases in where they belong and closing gaps on the way
+        positions = {entry["id"]: position for position, entry in enumerate(entries)}
+        previous = release.id if reached_known else fresh[-1]["id"] if fresh else None
+        for release in pages:
+            if release.id in positions:
+                gaps.discard(previous)
+            else:
+                fetched[release.id] = release
+                position = positions[previous] + 1 if previous in positions else len(entries)
+                entries.insert(position, _release_entry(release))
+                positions = {entry["id"]: position for position, entry in enumerate(entries)}
+                if previous in gaps:
+                    gaps.discard(previous)
+                    gaps.add(release.id)
+            previous = release.id
+            if resolved(entries):
+                break
+        else:
+            complete = True
+            gaps.discard(previous)
+
+    cache.save_json(index_name, {"releases": entries, "complete": complete, "gaps": sorted(gaps)})
+    logging.info(
+        f"Release index {repo_obj.full_name}: {len(fetched)} fetched, "
+        f"{len(entries) - len(fetched)} from cache"
+    )
+    return entries, fetched
+
+def forget_release(repo_obj, release_id: int) -> None:
+    index_name = _release_index_name(repo_obj)
+    index = cache.load_json(index_name)
+    if index:
+        releases = index.get("releases", [])
+        ids = [e["id"] for e in releases]
+        if release_id in index.get("gaps", []):
+            # The gap now follows the release before the forgotten one
+            index["gaps"].remove(release_id)
+            position = ids.index(release_id) if release_id in ids else 0
+            if position:
+                index["gaps"].append(ids[position - 1])
+        index["releases"] = [e for e in releases if e["id"] != release_id]
+        cache.save_json(index_name, index)
+
 def detect_github_release(user: str, repo: str, tag: str) -> dict:
     repo_obj = gh.get_repo(f"{user}/{repo}")
 
@@ -153,22 +405,28 @@ def detect_github_release(user: str, repo: str, tag: str) -> dict:
         return release.raw_data
 
     if tag in ["", "dev", "prerelease"]:
-        releases = list(repo_obj.get_releases())
-        if not releases:
-            raise ValueError(f"No releases found for {user}/{repo}")
-
-        if tag == "":
-            release = max(releases, key=lambda x: x.created_at)
-        elif tag == "dev":
-            devs = [r for r in releases if 'dev' in r.tag_name.lower()]
-            if not devs:
-                raise ValueError(f"No dev release found for {user}/{repo}")
-            release = max(devs, key=lambda x: x.created_at)
-        else:
-            pres = [r for r in releases if r.prerelease]
-            if not pres:
-                raise ValueError(f"No prerelease found for {user}/{repo}")
-            release = max(pres, key=lambda x: x.created_at)
+        predicate, kind = {
+            "": (lambda entry: True, "release"),
+            "dev": (lambda entry: 'dev' in entry["tag"].lower(), "dev release"),
+            "prerelease": (lambda entry: entry["prerelease"], "prerelease"),
+        }[tag]
+
+        while True:
+            entries, fetched = resolve_releases(repo_obj, predicate)
+            if not entries:
+                raise ValueError(f"No releases found for {user}/{repo}")
+
+            matches = [entry for entry in entries if predicate(entry)]
+            if not matches:
+                raise ValueError(f"No {kind} found for {user}/{repo}")
+
+            entry = max(matches, key=lambda x: x["created_at"])
+            try:
+                release = fetched.get(entry["id"]) or repo_obj.get_release(entry["id"])
+                break
+            except UnknownObjectException:
+                # Deleted upstream since it was indexed
+                forget_release(repo_obj, entry["id"])
 
         logging.info(f"Fetched release: {release.tag_name}")
         return release.raw_data
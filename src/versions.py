@@ -0,0 +1,103 @@
+import sys
+import copy
+import json
+import time
+import logging
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from src import (
+    apkpure,
+    uptodown,
+    apkmirror,
+    download_workers,
+    version_manifest
+)
+
+MANIFEST_MAX_AGE = 6 * 3600
+
+_app_configs = {}
+
+def load_patch_list(config_path: Path = Path("patch-config.json")) -> list[dict]:
+    with config_path.open() as f:
+        return json.load(f)["patch_list"]
+
+def app_config_path(platform: str, app_name: str) -> Path:
+    return Path("apps") / platform / f"{app_name}.json"
+
+def load_app_config(platform: str, app_name: str) -> dict | None:
+    """apps/<platform>/<app_name>.json, read once per process; callers get their own copy"""
+    key = (platform, app_name)
+    if key not in _app_configs:
+        config_path = app_config_path(platform, app_name)
+        if config_path.exists():
+            with config_path.open() as f:
+                _app_configs[key] = json.load(f)
+        else:
+            _app_configs[key] = None
+    config = _app_configs[key]
+    return copy.deepcopy(config) if config is not None else None
+
+def resolve_all(app_names: list[str], platforms: list[str], workers: int = download_workers) -> dict:
+    """platform -> app_name -> latest version for every app, sharing feeds where a mirror has one"""
+    manifest = {}
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        for platform in platforms:
+            platform_module = globals()[platform]
+            configs = {
+                app_name: config
+                for app_name in dict.fromkeys(app_names)
+                if (config := load_app_config(platform, app_name)) and not config.get("version")
+            }
+
+            versions = {}
+            if platform == "apkmirror" and configs:
+                try:
+                    versions = apkmirror.latest_versions_from_feed(configs)
+                except Exception as e:
+                    logging.warning(f"APKMirror uploads feed failed: {e}")
+
+            def lookup(app_name: str) -> str | None:
+                try:
+                    return platform_module.get_latest_version(app_name, configs[app_name])
+                except Exception as e:
+                    logging.warning(f"{platform}: no version for {app_name}: {e}")
+                    return None
+
+            # Whatever the shared feed didn't cover is looked up per app, concurrently
+            missing = [app_name for app_name in configs if app_name not in versions]
+            for app_name, version in zip(missing, pool.map(lookup, missing)):
+                if version:
+                    versions[app_name] = version
+
+            manifest[platform] = versions
+            logging.info(f"{platform}: {len(versions)}/{len(configs)} version(s) resolved")
+    return manifest
+
+def write_manifest(manifest: dict, path: Path = version_manifest) -> None:
+    with path.open("w") as f:
+        json.dump({"generated_at": time.time(), "versions": manifest}, f, indent=2)
+    logging.info(f"Version manifest written: {path}")
+
+def manifest_version(platform: str, app_name: str, path: Path = version_manifest) -> str | None:
+    """Latest version from a recent manifest, if there is one"""
+    if not path.exists():
+        return None
+    try:
+        with path.open() as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if time.time() - manifest.get("generated_at", 0) > MANIFEST_MAX_AGE:
+        return None
+    version = manifest.get("versions", {}).get(platform, {}).get(app_name)
+    if version:
+        logging.info(f"Using manifest version {version} for {app_name} on {platform}")
+    return version
+
+def main():
+    platforms = sys.argv[1:] or ["apkmirror"]
+    app_names = [entry["app_name"] for entry in load_patch_list()]
+    write_manifest(resolve_all(app_names, platforms))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import os
+import time
+import shutil
+import logging
+import tempfile
+import threading
+import contextlib
+from pathlib import Path
+from src import cache, utils, tmpfs_root, jvm_memory_mb, workspace_root, workspace_tmpfs
+
+STATS_FILE = "workspace-stats.json"
+SAMPLE_INTERVAL = 1.0
+WALK_INTERVAL = 15.0
+
+_stats_lock = threading.Lock()
+_meters = {}  # Workspace path -> its DiskMeter, for checkpoint()
+
+def disk_usage(path: Path) -> int:
+    """Bytes allocated under path, counting hard-linked files once"""
+    seen = set()
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                stat = os.lstat(os.path.join(root, name))
+            except OSError:
+                continue  # Removed while walking
+            if (stat.st_dev, stat.st_ino) not in seen:
+                seen.add((stat.st_dev, stat.st_ino))
+                total += stat.st_blocks * 512
+    return total
+
+def filesystem_used(path: Path) -> int | None:
+    """Bytes in use on the filesystem holding path"""
+    try:
+        stat = os.statvfs(path)
+    except OSError:
+        return None
+    return (stat.f_blocks - stat.f_bfree) * stat.f_frsize
+
+class DiskMeter:
+    """Samples the disk usage of a directory in the background, keeping the peak.
+
+    Walking a workspace full of decoded resources costs real CPU, so the
+    filesystem's usage is checked every interval and the directory is only
+    walked, at most every walk_interval, when the filesystem has grown past
+    its level at the last peak. Short-lived peaks between two walks are
+    caught by sampling at stage boundaries, see checkpoint().
+    """
+
+    def __init__(self, path: Path, interval: float = SAMPLE_INTERVAL, walk_interval: float = WALK_INTERVAL):
+        self.path, self.interval, self.walk_interval, self.peak = path, interval, walk_interval, 0
+        self.peak_filesystem_used = 0
+        self.last_walk = float("-inf")
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            if time.monotonic() - self.last_walk < self.walk_interval:
+                continue
+            used = filesystem_used(self.path)
+            if used is None or used > self.peak_filesystem_used:
+                self.sample(used)
+
+    def sample(self, filesystem_used_now: int | None = None) -> None:
+        with self.lock:
+            self.last_walk = time.monotonic()
+            usage = disk_usage(self.path)
+            if usage >= self.peak:
+                self.peak = usage
+                self.peak_filesystem_used = filesystem_used_now or 0
+
+    def start(self) -> "DiskMeter":
+        self.thread.start()
+        return self
+
+    def stop(self) -> int:
+        self.stopped.set()
+        self.thread.join()
+        self.sample(filesystem_used(self.path))
+        return self.peak
+
+def checkpoint(path: Path) -> None:
+    """Sample the workspace holding path right away, at a stage boundary of its build"""
+    path = Path(path).resolve()
+    for root in (path, *path.parents):
+        meter = _meters.get(root)
+        if meter is not None:
+            meter.sample(filesystem_used(root))
+            return
+
+def previous_peak(label: str) -> int | None:
+    """Peak disk usage of the last workspace with this label"""
+    return cache.load_json(STATS_FILE).get(label, {}).get("peak_bytes")
+
+def _record_peak(label: str, root: Path, peak: int, seconds: float) -> None:
+    with _stats_lock:
+        stats = cache.load_json(STATS_FILE)
+        stats[label] = {"peak_bytes": peak, "root": str(root), "seconds": round(seconds, 1)}
+        cache.save_json(STATS_FILE, stats)
+
+def scratch_root(size_hint: int | None) -> Path:
+    """Where a workspace of about size_hint bytes goes: tmpfs when it fits, else workspace_root.
+
+    In auto mode tmpfs must hold the workspace and still leave room in memory
+    for a JVM heap, so a large build never pushes the machine into swap.
+    """
+    if workspace_tmpfs == "0" or not tmpfs_root.is_dir():
+        return workspace_root
+    tmpfs_work = tmpfs_root / "revanced-work"
+    if workspace_tmpfs == "1":
+        return tmpfs_work
+    if not size_hint:
+        return workspace_root
+
+    try:
+        free = shutil.disk_usage(tmpfs_root).free
+    except OSError:
+        return workspace_root
+    available_mb = utils.available_memory_mb()
+    if available_mb is None or free < size_hint or available_mb < size_hint // 2**20 + jvm_memory_mb:
+        return workspace_root
+    return tmpfs_work
+
+@contextlib.contextmanager
+def workspace(label: str, size_hint: int = None):
+    """Scratch directory for one build, removed on every exit path.
+
+    size_hint (default: the last peak recorded for label) decides whether it
+    fits on tmpfs. The peak disk usage is logged and kept in workspace-stats.json.
+    """
+    root = scratch_root(size_hint or previous_peak(label))
+    root.mkdir(parents=True, exist_ok=True)
+    path = Path(tempfile.mkdtemp(prefix=f"{label}-", dir=root)).resolve()
+    meter = _meters[path] = DiskMeter(path).start()
+    started = time.monotonic()
+    try:
+        yield path
+    finally:
+        peak = meter.stop()
+        _meters.pop(path, None)
+        shutil.rmtree(path, ignore_errors=True)
+        logging.info(f"📦 Workspace {label}: peak {peak / 2**20:.1f} MB on {root}")
+        _record_peak(label, root, peak, time.monotonic() - started)